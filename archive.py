@@ -0,0 +1,357 @@
+"""
+Compact binary archive of the posts of a campaign, for getting at any range of
+them without going through the whole chatlog.
+
+An archive is three append-only files named after the campaign ID:
+
+- .strings: every speaker and post type, stored once. Records refer to them
+  by their position in here.
+- .records: one record per post, in the order they were downloaded.
+- .index: the offset of each record in .records, 8 bytes apiece, in
+  chronological order. Post N is at offset N * 8, so there's no need to read
+  anything else to find it.
+
+Numbers other than offsets are varints: 7 bits a byte, least significant
+first, the top bit set on all bytes but the last. Strings and records are
+framed by their length. Records hold the speaker and type references, each
+the position of the string plus one, then the post ID, playerid, target,
+content and roll total as strings, each prefixed with its length plus one. In
+both, 0 stands for None. The roll total is kept as JSON, so it comes back the
+number it was.
+
+    python archive.py ARCHIVE_DIR CAMPAIGN_ID [START [STOP]]
+
+prints posts START to STOP of a campaign as text.
+"""
+import json
+from bisect import bisect_left
+from mmap import mmap, ACCESS_READ
+from os import path
+from struct import Struct
+from sys import argv, stdout
+
+from parsers import PostType, format_post
+import profiler
+
+
+OFFSET = Struct('<Q')
+
+
+def _filepaths(directory, campaign_id):
+    return ['{}/{}.{}'.format(directory, campaign_id, kind) for kind in ('strings', 'records', 'index')]
+
+
+def _read_strings(filepath):
+    # returns the strings and how many bytes of the file they take up
+    strings = []
+    try:
+        with open(filepath, 'rb') as strings_file:
+            data = strings_file.read()
+    except FileNotFoundError:
+        return strings, 0
+    pos = 0
+    # a string cut short by a crash is simply not there
+    while pos < len(data):
+        try:
+            length, start = _read_varint(data, pos)
+        except IndexError:
+            break
+        if start + length > len(data):
+            break
+        strings.append(data[start:start + length].decode())
+        pos = start + length
+    return strings, pos
+
+
+def _truncate(filepath, size):
+    if path.exists(filepath) and path.getsize(filepath) > size:
+        with open(filepath, 'r+b') as truncated_file:
+            truncated_file.truncate(size)
+
+
+def _varint(n):
+    encoded = bytearray()
+    while n >= 0x80:
+        encoded.append(n & 0x7f | 0x80)
+        n >>= 7
+    encoded.append(n)
+    return bytes(encoded)
+
+
+def _read_varint(buf, pos):
+    n = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _encode(value):
+    if value is None:
+        return b'\x00'
+    value = str(value).encode()
+    return _varint(len(value) + 1) + value
+
+
+def _decode(buf, pos):
+    length, pos = _read_varint(buf, pos)
+    if length == 0:
+        return None, pos
+    return bytes(buf[pos:pos + length - 1]).decode(), pos + length - 1
+
+
+def _encode_total(total):
+    return _encode(json.dumps(total) if total is not None else None)
+
+
+def _decode_total(buf, pos):
+    total, pos = _decode(buf, pos)
+    return (json.loads(total) if total is not None else None), pos
+
+
+def _post_id_at(buf, offset):
+    # skips the frame and the two references
+    pos = _read_varint(buf, offset)[1]
+    pos = _read_varint(buf, pos)[1]
+    pos = _read_varint(buf, pos)[1]
+    return _decode(buf, pos)[0]
+
+
+class ArchiveWriter:
+    """
+    Appends the posts of an export to the archive of its campaign. Only posts
+    newer than the newest one already in there are added, so downloading a
+    chatlog again, whole or in part, never makes duplicates.
+
+    Pages come in any order: their records are appended as they come, while
+    their offsets wait in pending_filepath, which works like a Checkpoint so
+    an interrupted export can pick up where it left off. Only on commit()
+    are they sorted into the index. keep(page) tells which pages of a
+    previous run to hold on to.
+    """
+
+    def __init__(self, directory, campaign_id, pending_filepath, keep):
+        strings_filepath, records_filepath, index_filepath = _filepaths(directory, campaign_id)
+        strings, size = _read_strings(strings_filepath)
+        # whatever a crash left behind has to go before anything is appended
+        _truncate(strings_filepath, size)
+        if path.exists(index_filepath):
+            _truncate(index_filepath, path.getsize(index_filepath) // OFFSET.size * OFFSET.size)
+        self._strings = {string: ref for ref, string in enumerate(strings)}
+        self._strings_file = open(strings_filepath, 'ab')
+        self._records_file = open(records_filepath, 'ab')
+        self._index_filepath = index_filepath
+        self._records_filepath = records_filepath
+        with ArchiveReader(directory, campaign_id) as reader:
+            self._newest_id = reader.newest_id()
+
+        # page -> offsets of its records
+        self._pending = {}
+        try:
+            with open(pending_filepath) as pending_file:
+                for line in pending_file:
+                    if line.endswith('\n'):
+                        page, *offsets = line.split()
+                        if keep(int(page)):
+                            self._pending[int(page)] = [int(offset) for offset in offsets]
+        except FileNotFoundError:
+            pass
+        self._pending_file = open(pending_filepath, 'w')
+        for page, offsets in sorted(self._pending.items()):
+            self._write_pending(page, offsets)
+        self._pending_file.flush()
+
+
+    def _intern(self, string):
+        # 0 for None, the position of the string plus one otherwise
+        if string is None:
+            return 0
+        ref = self._strings.get(string)
+        if ref is None:
+            ref = self._strings[string] = len(self._strings)
+            encoded = string.encode()
+            self._strings_file.write(_varint(len(encoded)) + encoded)
+        return ref + 1
+
+
+    def add(self, page, rows):
+        """Adds rows as kept by parsers.PostRenderer."""
+        if not profiler.enabled:
+            self._add(page, rows)
+            return
+        size = self._records_file.tell()
+        start = profiler.enter()
+        try:
+            self._add(page, rows)
+        finally:
+            profiler.leave('archive', start, self._records_file.tell() - size, len(rows))
+
+
+    def _add(self, page, rows):
+        if self._newest_id is not None:
+            rows = [row for row in rows if row[0] > self._newest_id]
+        rows = sorted(rows, key=lambda row: row[0])
+        offset = self._records_file.tell()
+        offsets = []
+        records = []
+        for post_id, type, who, playerid, target, content, total in rows:
+            record = b''.join([
+                _varint(self._intern(who)),
+                _varint(self._intern(type)),
+                _encode(post_id),
+                _encode(playerid),
+                _encode(target),
+                _encode(content),
+                _encode_total(total),
+                ])
+            frame = _varint(len(record))
+            records.append(frame)
+            records.append(record)
+            offsets.append(offset)
+            offset += len(frame) + len(record)
+        # strings first: records must never refer to a string that isn't
+        # on disk
+        self._strings_file.flush()
+        self._records_file.write(b''.join(records))
+        self._records_file.flush()
+        self._pending[page] = offsets
+        self._write_pending(page, offsets)
+        self._pending_file.flush()
+
+
+    def _write_pending(self, page, offsets):
+        self._pending_file.write(' '.join(str(n) for n in [page] + offsets) + '\n')
+
+
+    def commit(self):
+        """Adds the posts of every page so far to the index, oldest first."""
+        offsets = [offset for page_offsets in self._pending.values() for offset in page_offsets]
+        self._records_file.close()
+        if offsets:
+            with open(self._records_filepath, 'rb') as records_file, \
+                    mmap(records_file.fileno(), 0, access=ACCESS_READ) as records:
+                # post IDs sort chronologically
+                offsets.sort(key=lambda offset: _post_id_at(records, offset))
+            with open(self._index_filepath, 'ab') as index_file:
+                index_file.write(b''.join(OFFSET.pack(offset) for offset in offsets))
+        self.close()
+
+
+    def close(self):
+        self._strings_file.close()
+        self._records_file.close()
+        self._pending_file.close()
+
+
+class ArchiveReader:
+    """
+    Random access to the posts in an archive. reader[n] is post n as a tuple
+    like the rows of parsers.PostRenderer, reader[start:stop] a list of them,
+    and text() streams them back out as chatlog lines.
+    """
+
+    def __init__(self, directory, campaign_id):
+        strings_filepath, records_filepath, index_filepath = _filepaths(directory, campaign_id)
+        self._strings = _read_strings(strings_filepath)[0]
+        self._files = []
+        self._records = self._map(records_filepath)
+        self._index = self._map(index_filepath)
+
+
+    def _map(self, filepath):
+        # an empty file can't be mapped, and there's nothing in it anyway
+        if not path.exists(filepath) or path.getsize(filepath) == 0:
+            return b''
+        mapped_file = open(filepath, 'rb')
+        self._files.append(mapped_file)
+        return mmap(mapped_file.fileno(), 0, access=ACCESS_READ)
+
+
+    def __len__(self):
+        return len(self._index) // OFFSET.size
+
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [self[i] for i in range(*n.indices(len(self)))]
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError('post {} not in archive'.format(n))
+        offset, = OFFSET.unpack_from(self._index, n * OFFSET.size)
+        pos = _read_varint(self._records, offset)[1]
+        who, pos = _read_varint(self._records, pos)
+        type, pos = _read_varint(self._records, pos)
+        post_id, pos = _decode(self._records, pos)
+        playerid, pos = _decode(self._records, pos)
+        target, pos = _decode(self._records, pos)
+        content, pos = _decode(self._records, pos)
+        total, pos = _decode_total(self._records, pos)
+        return post_id, self._string(type), self._string(who), playerid, target, content, total
+
+
+    def _string(self, ref):
+        return self._strings[ref - 1] if ref else None
+
+
+    def newest_id(self):
+        return self[-1][0] if len(self) else None
+
+
+    def find(self, post_id):
+        """The position of the first post not older than post_id."""
+        # the index is in chronological order, and post IDs sort that way
+        return bisect_left(_PostIds(self), post_id)
+
+
+    def text(self, start=0, stop=None):
+        """Yields the chatlog lines of posts start to stop."""
+        for n in range(*slice(start, stop).indices(len(self))):
+            post_id, type, who, playerid, target, content, total = self[n]
+            line = format_post(PostType.from_string(type), who, content, total, target)
+            if line is not None:
+                yield line
+
+
+    def close(self):
+        for mapped in (self._records, self._index):
+            if mapped:
+                mapped.close()
+        for mapped_file in self._files:
+            mapped_file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _PostIds:
+    # lets bisect look at post IDs without decoding whole posts
+
+    def __init__(self, reader):
+        self._reader = reader
+
+
+    def __len__(self):
+        return len(self._reader)
+
+
+    def __getitem__(self, n):
+        offset, = OFFSET.unpack_from(self._reader._index, n * OFFSET.size)
+        return _post_id_at(self._reader._records, offset)
+
+
+if __name__ == '__main__':
+    with ArchiveReader(argv[1], argv[2]) as reader:
+        start = int(argv[3]) if len(argv) > 3 else 0
+        stop = int(argv[4]) if len(argv) > 4 else None
+        for line in reader.text(start, stop):
+            stdout.write(line)
@@ -0,0 +1,63 @@
+"""
+Which JSON backend of jsonstreamer wins at which page size: the decoded
+msgdata payload of synthetic pages of a few sizes through JSONStreamer, no
+listeners, in 64 KiB chunks like run.py, for each backend that can be loaded.
+
+yajl only gets measured where its shared library can be found, otherwise the
+table is stdlib alone. Small pages are parsed many times over so every size
+runs for about as long; times are the best of a few runs.
+
+    python benchmarks/backends.py [--posts 10,100,1000,10000,50000]
+"""
+import gc
+from argparse import ArgumentParser
+from os import path
+from sys import path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from jsonstreamer.jsonstreamer import BACKENDS, DEFAULT_BACKEND
+from jsonstreamer.yajl.parse import yajl
+
+from run import run_json
+from synthetic import make_payload
+
+
+def measure(function, payload, loops, repeat):
+    elapsed = None
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = perf_counter()
+            for _ in range(loops):
+                function(payload)
+            elapsed = min(elapsed or float('inf'), (perf_counter() - start) / loops)
+    finally:
+        gc.enable()
+    return elapsed
+
+
+def main():
+    arguments = ArgumentParser(description=__doc__.split('\n\n')[0])
+    arguments.add_argument('--posts', default='10,100,1000,10000,50000', help='posts per page to try (default 10,100,1000,10000,50000)')
+    arguments.add_argument('--seed', type=int, default=0)
+    arguments.add_argument('--repeat', type=int, default=3, help='runs per size, the best one counts (default 3)')
+    options = arguments.parse_args()
+
+    backends = [backend for backend in sorted(BACKENDS) if backend != 'yajl' or yajl is not None]
+    if yajl is None:
+        print('yajl could not be loaded, measuring stdlib only')
+    print('default backend: {}'.format(DEFAULT_BACKEND))
+    print('{:>8}{:>10}'.format('posts', 'MB') + ''.join('{:>14}'.format(backend + ' MB/s') for backend in backends) + '  winner')
+    for posts in [int(n) for n in options.posts.split(',')]:
+        payload = make_payload(posts, seed=options.seed)
+        loops = max(1, 20000 // posts)
+        speeds = {backend: len(payload) / measure(run_json(backend), payload, loops, options.repeat) / 1e6 for backend in backends}
+        print('{:>8}{:>10.2f}'.format(posts, len(payload) / 1e6)
+              + ''.join('{:>14.1f}'.format(speeds[backend]) for backend in backends)
+              + '  ' + max(speeds, key=speeds.get))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+The whole download pipeline against mock_roll20.py, for each of a few
+max_concurrency settings: login, then a full dump of a synthetic campaign,
+printing wall-clock time, pages/s and MB/s of each run. With --profile, each
+run also gets the breakdown of chronicler.py --profile (see profiler.py).
+
+The mock server runs in a process of its own, so it doesn't eat into the
+client's share of the CPU, with whatever latency, bandwidth and failures are
+asked for (see mock_roll20.py for those options). The client runs with the
+default settings of config.py otherwise, from a scratch directory so it
+doesn't touch the cookiejar or the cache of a real install.
+
+    python benchmarks/load.py [--concurrency 1,4,16] [--campaigns 1] [--profile] [mock_roll20.py options]
+"""
+import asyncio
+import subprocess
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from logging import getLogger, INFO
+from os import chdir, path
+from shutil import rmtree
+from socket import create_connection
+from sys import executable, path as sys_path
+from tempfile import mkdtemp
+from time import perf_counter, sleep
+
+sys_path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import config
+import profiler
+import roll20
+
+import mock_roll20
+
+
+MOCK = path.join(path.dirname(path.abspath(__file__)), 'mock_roll20.py')
+
+
+def start_server(port, mock_arguments):
+    server = subprocess.Popen([executable, MOCK, '--port', str(port)] + mock_arguments, stdout=subprocess.DEVNULL)
+    # wait for it to listen
+    for _ in range(100):
+        try:
+            create_connection(('localhost', port)).close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError('mock server failed to start')
+            sleep(0.1)
+    server.kill()
+    raise RuntimeError('mock server never came up')
+
+
+def configure(base_url, concurrency, overrides):
+    options = ConfigParser()
+    options.read_dict(config.defaults)
+    options['options']['base_url'] = base_url
+    options['options']['max_concurrency'] = str(concurrency)
+    options['options']['initial_concurrency'] = str(min(concurrency, int(options['options']['initial_concurrency'])))
+    options['options']['connection_limit'] = str(max(concurrency, int(options['options']['connection_limit'])))
+    for key, value in overrides:
+        options['options'][key] = value
+    roll20.configure(options['options'])
+
+
+async def run(campaigns, profile):
+    if profile:
+        profiler.enable()
+    try:
+        await roll20.new_session('bench@example.com', 'bench')
+        start = perf_counter()
+        exports = [roll20.dump_chatlog(str(n), 'campaign_{}.txt'.format(n)) for n in range(1, campaigns + 1)]
+        await asyncio.gather(*exports)
+        elapsed = perf_counter() - start
+        if profile:
+            print('')
+            print(profiler.summary(profiler.report()))
+        return elapsed
+    finally:
+        await roll20.close_session()
+
+
+def main():
+    arguments = ArgumentParser(description=__doc__.split('\n\n')[0])
+    arguments.add_argument('--concurrency', default='1,4,16', help='max_concurrency settings to try (default 1,4,16)')
+    arguments.add_argument('--campaigns', type=int, default=1, help='campaigns dumped at once (default 1)')
+    arguments.add_argument('--set', action='append', default=[], metavar='OPTION=VALUE', help='any other config.ini option')
+    arguments.add_argument('--port', type=int, default=8020)
+    arguments.add_argument('--profile', action='store_true', help='print where the time of each run went')
+    options, mock_arguments = arguments.parse_known_args()
+    # everything else is for the mock server, as it was given
+    mock_options = ArgumentParser(prog='mock_roll20.py')
+    mock_roll20.add_arguments(mock_options)
+    mock_options = mock_options.parse_args(mock_arguments)
+    overrides = [setting.split('=', 1) for setting in options.set]
+
+    # again turns on DEBUG logging for everything as soon as it's imported
+    for logger in ('asyncio', 'roll20', 'scheduler', 'aiohttp.access'):
+        getLogger(logger).setLevel(INFO)
+
+    pages = mock_options.pages
+    page_bytes = len(mock_roll20.from_arguments(mock_options).page('1', 1)[0])
+    total_bytes = page_bytes * pages * options.campaigns
+    print('{} campaign(s) of {} pages of {} posts, {:.1f} MB each'.format(
+        options.campaigns, pages, mock_options.posts, page_bytes * pages / 1e6))
+
+    server = start_server(options.port, mock_arguments)
+    scratch = mkdtemp()
+    cwd = path.abspath('.')
+    chdir(scratch)
+    try:
+        results = []
+        for concurrency in [int(n) for n in options.concurrency.split(',')]:
+            configure('http://localhost:{}'.format(options.port), concurrency, overrides)
+            try:
+                results.append((concurrency, asyncio.run(run(options.campaigns, options.profile))))
+            except (roll20.HTTPError, roll20.LoginError) as e:
+                # which is the point of some of the mock server options
+                results.append((concurrency, e.message))
+        print('')
+        for concurrency, elapsed in results:
+            if isinstance(elapsed, str):
+                print('max_concurrency {:>3}: {}'.format(concurrency, elapsed))
+                continue
+            print('max_concurrency {:>3}: {:7.2f}s {:8.1f} pages/s {:7.1f} MB/s'.format(
+                concurrency,
+                elapsed,
+                pages * options.campaigns / elapsed,
+                total_bytes / elapsed / 1e6))
+    finally:
+        chdir(cwd)
+        rmtree(scratch)
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
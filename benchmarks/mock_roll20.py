@@ -0,0 +1,224 @@
+"""
+A local stand-in for the bits of Roll20 the chronicler talks to, for
+end-to-end testing without an account or a campaign:
+
+- POST /sessions/create logs in (any credentials, unless --password is set)
+- GET /account/ checks the session, like Roll20 does on startup
+- GET /campaigns/chatarchive/ID[/?p=N] serves synthetic chat archive pages
+  (see synthetic.py), any campaign ID being a campaign of --pages pages
+
+Pages come after --latency seconds (give or take --jitter) and, with
+--bandwidth, all responses together share a link that slow. Pages are
+gzipped for clients that ask, like Roll20 does. To make things go wrong:
+
+- --session-lifetime: sessions expire after that many seconds, and chat
+  archive requests get a 302 to the login page
+- --forbidden ID: that campaign is off limits, with a 403
+- --max-in-flight N: past N chat archive requests at once, a 429
+- --error-rate P: that share of chat archive requests gets a 503
+
+Point the chronicler at it with base_url in config.ini, or see load.py.
+
+    python benchmarks/mock_roll20.py [--port 8020] [--pages 2000] [--posts 100] ...
+"""
+import asyncio
+import gzip
+from argparse import ArgumentParser
+from functools import lru_cache
+from os import path
+from random import Random, uniform
+from secrets import token_hex
+from sys import path as sys_path
+from time import monotonic
+
+sys_path.insert(0, path.dirname(path.abspath(__file__)))
+
+from aiohttp import web
+
+import synthetic
+
+
+COOKIE = 'rack.session'
+CHUNK = 16 * 1024
+
+
+class MockRoll20:
+
+    def __init__(self, pages=2000, posts=100, is_gm=False, latency=0.0, jitter=0.0, bandwidth=0,
+            session_lifetime=0, forbidden=(), max_in_flight=0, error_rate=0.0, password=None, compress=True, seed=0):
+        self.pages = pages
+        self.posts = posts
+        self.is_gm = is_gm
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.session_lifetime = session_lifetime
+        self.forbidden = set(str(campaign_id) for campaign_id in forbidden)
+        self.max_in_flight = max_in_flight
+        self.error_rate = error_rate
+        self.password = password
+        self.compress = compress
+        self._random = Random(seed)
+        # session token -> when it was logged in, None if it never was
+        self._sessions = {}
+        self._in_flight = 0
+        # when the shared link is next free, see _send()
+        self._link_free = 0.0
+        # what was served, for whoever wants to know
+        self.stats = {'pages': 0, 'bytes': 0, 302: 0, 403: 0, 429: 0, 503: 0}
+        self.page = lru_cache(maxsize=256)(self._make_page)
+
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/sessions/create', self.sessions_create)
+        app.router.add_get('/account/', self.account)
+        app.router.add_get('/campaigns/chatarchive/{campaign_id}', self.chatarchive)
+        app.router.add_get('/campaigns/chatarchive/{campaign_id}/', self.chatarchive)
+        return app
+
+
+    def _make_page(self, campaign_id, pageno):
+        # page 1 is the newest, so post IDs count down with the page number
+        page = synthetic.make_page(
+                self.posts,
+                pages=self.pages,
+                is_gm=self.is_gm,
+                seed='{}/{}'.format(campaign_id, pageno),
+                first_id=(self.pages - pageno) * self.posts
+                )
+        return page, gzip.compress(page, 6) if self.compress else None
+
+
+    def _set_session(self, response, token):
+        # Roll20 really does send its dates with -0000, see roll20._load_rack_session()
+        response.headers.add('Set-Cookie', '{}={}; path=/; expires=Sun, 01 Nov 2099 00:00:00 -0000; HttpOnly'.format(COOKIE, token))
+
+
+    def _logged_in(self, request):
+        logged_in = self._sessions.get(request.cookies.get(COOKIE))
+        if logged_in is None:
+            return False
+        return not self.session_lifetime or monotonic() - logged_in < self.session_lifetime
+
+
+    def _redirect(self, request, location):
+        return web.Response(status=302, headers={'Location': str(request.url.origin()) + location})
+
+
+    async def sessions_create(self, request):
+        form = await request.post()
+        token = token_hex(16)
+        if not form.get('email') or (self.password is not None and form.get('password') != self.password):
+            response = self._redirect(request, '/sessions/new')
+            self._sessions[token] = None
+        else:
+            response = self._redirect(request, '/')
+            self._sessions[token] = monotonic()
+        self._set_session(response, token)
+        return response
+
+
+    async def account(self, request):
+        token = request.cookies.get(COOKIE)
+        if self._logged_in(request):
+            response = web.Response(text='<html>account</html>', content_type='text/html')
+        else:
+            response = self._redirect(request, '/sessions/new')
+            token = token_hex(16)
+            self._sessions[token] = None
+        self._set_session(response, token)
+        return response
+
+
+    async def chatarchive(self, request):
+        campaign_id = request.match_info['campaign_id']
+        pageno = int(request.query.get('p', 1))
+        if not self._logged_in(request):
+            self.stats[302] += 1
+            return self._redirect(request, '/sessions/new')
+        if campaign_id in self.forbidden:
+            self.stats[403] += 1
+            return web.Response(status=403)
+        if not 1 <= pageno <= self.pages:
+            return web.Response(status=404)
+        if self.max_in_flight and self._in_flight >= self.max_in_flight:
+            self.stats[429] += 1
+            return web.Response(status=429)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.stats[503] += 1
+            return web.Response(status=503)
+
+        self._in_flight += 1
+        try:
+            await asyncio.sleep(max(0.0, self.latency + uniform(-self.jitter, self.jitter)))
+            page, compressed = self.page(campaign_id, pageno)
+            response = web.StreamResponse(headers={'Content-Type': 'text/html; charset=utf-8'})
+            if compressed is not None and 'gzip' in request.headers.get('Accept-Encoding', ''):
+                page = compressed
+                response.headers['Content-Encoding'] = 'gzip'
+            response.content_length = len(page)
+            await response.prepare(request)
+            await self._send(response, page)
+            await response.write_eof()
+        except ConnectionResetError:
+            # the client hung up, like the chronicler does on a 302
+            return response
+        finally:
+            self._in_flight -= 1
+        self.stats['pages'] += 1
+        self.stats['bytes'] += len(page)
+        return response
+
+
+    async def _send(self, response, data):
+        for i in range(0, len(data), CHUNK):
+            chunk = data[i:i + CHUNK]
+            if self.bandwidth:
+                # one link for everybody: each chunk goes out once the ones
+                # before it, whoever they were for, are through
+                now = monotonic()
+                self._link_free = max(now, self._link_free) + len(chunk) / self.bandwidth
+                await asyncio.sleep(self._link_free - now)
+            await response.write(chunk)
+
+
+def add_arguments(arguments):
+    arguments.add_argument('--pages', type=int, default=2000, help='pages per campaign (default 2000)')
+    arguments.add_argument('--posts', type=int, default=100, help='posts per page (default 100)')
+    arguments.add_argument('--gm', action='store_true', help='log in as the GM of every campaign')
+    arguments.add_argument('--latency', type=float, default=0.05, help='seconds before a page starts coming (default 0.05)')
+    arguments.add_argument('--jitter', type=float, default=0.02, help='give or take this much latency (default 0.02)')
+    arguments.add_argument('--bandwidth', type=float, default=0, help='bytes/s for all responses together, 0 for no limit')
+    arguments.add_argument('--session-lifetime', type=float, default=0, help='seconds before sessions expire, 0 for never')
+    arguments.add_argument('--forbidden', action='append', default=[], metavar='ID', help='a campaign that gets a 403')
+    arguments.add_argument('--max-in-flight', type=int, default=0, help='chat archive requests at once before a 429, 0 for no limit')
+    arguments.add_argument('--error-rate', type=float, default=0.0, help='share of chat archive requests that get a 503')
+    arguments.add_argument('--password', help='the only password accepted, if any')
+    arguments.add_argument('--no-gzip', dest='compress', action='store_false', help="don't compress pages")
+
+
+def from_arguments(options):
+    return MockRoll20(
+            pages=options.pages,
+            posts=options.posts,
+            is_gm=options.gm,
+            latency=options.latency,
+            jitter=options.jitter,
+            bandwidth=options.bandwidth,
+            session_lifetime=options.session_lifetime,
+            forbidden=options.forbidden,
+            max_in_flight=options.max_in_flight,
+            error_rate=options.error_rate,
+            password=options.password,
+            compress=options.compress
+            )
+
+
+if __name__ == '__main__':
+    arguments = ArgumentParser(description=__doc__.split('\n\n')[0])
+    arguments.add_argument('--port', type=int, default=8020)
+    add_arguments(arguments)
+    options = arguments.parse_args()
+    print('serving on http://localhost:{}'.format(options.port))
+    web.run_app(from_arguments(options).app(), host='localhost', port=options.port, print=None)
@@ -0,0 +1,75 @@
+"""
+How page parsing scales with the number of worker processes.
+
+Parses the same batch of synthetic chatlog pages in the main process and then
+through a ParsePool with 1 up to as many workers as there are cores, and
+prints the wall-clock time of each run.
+
+    python benchmarks/parse_pool.py [pages] [posts per page]
+"""
+import asyncio
+from os import cpu_count, path
+from sys import argv, path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from parsers import parse_page
+from scheduler import ParsePool
+
+from synthetic import PLAYERID, make_page
+
+
+async def chunked(data):
+    for i in range(0, len(data), 64 * 1024):
+        yield data[i:i + 64 * 1024]
+
+
+async def run(pool, pages):
+    loop_stalls = []
+
+    # how late the event loop gets to a timer: what downloads would suffer
+    async def heartbeat():
+        while True:
+            before = perf_counter()
+            await asyncio.sleep(0.01)
+            loop_stalls.append(perf_counter() - before - 0.01)
+
+    async def one(page):
+        if pool is None:
+            parse_page(page, PLAYERID, False)
+        else:
+            await pool.run(chunked(page), parse_page, PLAYERID, False)
+
+    beat = asyncio.ensure_future(heartbeat())
+    start = perf_counter()
+    await asyncio.gather(*[one(page) for page in pages])
+    elapsed = perf_counter() - start
+    beat.cancel()
+    return elapsed, max(loop_stalls, default=elapsed)
+
+
+async def main():
+    page_count = int(argv[1]) if len(argv) > 1 else 32
+    posts = int(argv[2]) if len(argv) > 2 else 2000
+    pages = [make_page(posts, seed=seed, first_id=seed * posts) for seed in range(page_count)]
+    size = sum(len(page) for page in pages) / 1e6
+    print('{} pages, {:.1f} MB, {} cores'.format(page_count, size, cpu_count()))
+
+    baseline = None
+    for workers in [0] + list(range(1, (cpu_count() or 1) + 1)):
+        pool = ParsePool(workers, 2) if workers else None
+        if pool is not None:
+            # spin up the processes before the clock starts
+            await pool.run(chunked(pages[0]), parse_page, PLAYERID, False)
+        elapsed, stall = await run(pool, pages)
+        if pool is not None:
+            pool.shutdown()
+        baseline = baseline or elapsed
+        print('{:>12}: {:6.2f}s, {:6.1f} MB/s, x{:.2f}, event loop stalled up to {:.3f}s'.format(
+            '{} workers'.format(workers) if workers else 'in-process',
+            elapsed, size / elapsed, baseline / elapsed, stall))
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,125 @@
+"""
+Post rendering, piece by piece, against the way it used to be done.
+
+Renders synthetic posts heavy on inline rolls and times, old against new:
+inline roll substitution (a str.replace per roll against one regex pass)
+and the whole of PostRenderer.render (the if/elif chain against the
+formatter tables).
+
+    python benchmarks/render.py [posts] [inline rolls per post]
+"""
+import json
+from os import path
+from random import Random
+from sys import argv, path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from parsers import PostRenderer, PostType, substitute_inlinerolls
+
+
+PLAYERID = '-Mbench'
+
+
+def make_posts(count, rolls):
+    random = Random(0)
+    types = [PostType.GENERAL, PostType.EMOTE, PostType.DESC, PostType.ROLLRESULT, PostType.GMROLLRESULT, PostType.WHISPER]
+    posts = []
+    for i in range(count):
+        type = random.choice(types)
+        inlinerolls = []
+        if type in (PostType.ROLLRESULT, PostType.GMROLLRESULT):
+            content = json.dumps({'type': 'V', 'total': random.randint(1, 20)})
+        else:
+            inlinerolls = ['1d{} = {}'.format(random.choice((4, 6, 8)), random.randint(1, 8)) for _ in range(rolls)]
+            content = ' and '.join(
+                    'hits for $[[{}]] {}'.format(n, 'lorem ipsum ' * random.randint(0, 20))
+                    for n in range(rolls)
+                    ) or 'lorem ipsum'
+        posts.append((
+            '-M{:07d}'.format(i),
+            type,
+            'Player {}'.format(i % 5),
+            content,
+            '1d20+5',
+            random.choice((PLAYERID, '-Mother')),
+            random.choice((PLAYERID, '-Mother')),
+            'Someone',
+            inlinerolls
+            ))
+    return posts
+
+
+def replace_inlinerolls(content, inlinerolls):
+    for i, roll in enumerate(inlinerolls):
+        content = content.replace('$[[%d]]' % i, roll)
+    return content
+
+
+class ChainRenderer(PostRenderer):
+    # render() as it was, if/elif chain and all
+
+    def render(self, post_id, type, who, content, origRoll, post_playerid, target_playerid, target_name, inlinerolls):
+        if post_id is not None:
+            if self.newest_id is None or post_id > self.newest_id:
+                self.newest_id = post_id
+            if self._since is not None and post_id <= self._since:
+                self.reached_since = True
+                return None
+        self.new_posts += 1
+        for i, roll in enumerate(inlinerolls):
+            content = content.replace( '$[[%d]]' % i, roll)
+        if type == PostType.GENERAL:
+            return ''.join([who, ': ', content, '\n'])
+        elif type == PostType.EMOTE:
+            return ''.join([who, ' ', content, '\n'])
+        elif type == PostType.DESC:
+            return ''.join([content, '\n'])
+        elif type == PostType.ROLLRESULT:
+            roll = json.loads(content)
+            return ''.join([who, ': ', origRoll, ' = ', str(roll['total']), '\n'])
+        elif type == PostType.GMROLLRESULT:
+            if post_playerid == self._playerid or self._is_gm:
+                roll = json.loads(content)
+                return ''.join([who, ' (to GM): ', origRoll, ' = ', str(roll['total']), '\n'])
+        elif type == PostType.WHISPER:
+            if post_playerid == self._playerid or self._playerid in target_playerid:
+                return ''.join([who, ' (whispering to ', target_name, '): ', content, '\n'])
+        return None
+
+
+def timed(function):
+    start = perf_counter()
+    result = function()
+    return perf_counter() - start, result
+
+
+def compare(name, old, new):
+    old_time, old_result = timed(old)
+    new_time, new_result = timed(new)
+    assert old_result == new_result, name
+    print('{:>14}: {:7.3f}s -> {:7.3f}s, x{:.2f}'.format(name, old_time, new_time, old_time / new_time))
+
+
+def main():
+    count = int(argv[1]) if len(argv) > 1 else 100000
+    rolls = int(argv[2]) if len(argv) > 2 else 12
+    posts = make_posts(count, rolls)
+    print('{} posts, {} inline rolls each'.format(count, rolls))
+
+    compare(
+        'substitution',
+        lambda: [replace_inlinerolls(post[3], post[8]) for post in posts],
+        lambda: [substitute_inlinerolls(post[3], post[8]) for post in posts]
+        )
+
+    compare(
+        'render',
+        lambda: [ChainRenderer(PLAYERID, False).render(*post) for post in posts],
+        lambda: [PostRenderer(PLAYERID, False).render(*post) for post in posts]
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Runs the chatlog parsing pipeline over a synthetic archive page, one stage at
+a time and then whole, and checks the numbers against a stored baseline.
+
+Stages, each fed in 64 KiB chunks like a download would:
+
+- tape: the decoded payload in and out of a jsonstreamer Tape
+- decode: the base64 msgdata payload through PayloadDecoder
+- json-<backend>: the decoded payload through JSONStreamer, no listeners,
+  for each JSON backend that can be loaded (yajl, stdlib)
+- sax: the decoded payload through JsonSaxParser, rendering included
+- streamed: the whole page through ChatParser
+- buffered: the whole page through BufferedChatParser
+
+Each gets MB/s of its own input, posts/s and peak memory as seen by
+tracemalloc. Timings are the best of a few runs with the garbage collector
+off; memory is taken on a run of its own, as tracemalloc slows everything
+down.
+
+With --save the results become the baseline. Otherwise, if there is one for
+the same page, every stage is compared against it and the run fails if any
+got slower or hungrier by more than --tolerance. Baselines only mean
+anything on the machine they were taken on.
+
+    python benchmarks/run.py [--posts N] [--save] [--baseline FILE]
+"""
+import gc
+import json
+import tracemalloc
+from argparse import ArgumentParser
+from io import StringIO
+from os import path
+from sys import exit, path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from jsonstreamer import JSONStreamer
+from jsonstreamer.jsonstreamer import BACKENDS
+from jsonstreamer.tape import Tape
+from jsonstreamer.yajl.parse import yajl
+from parsers import BufferedChatParser, ChatParser, JsonSaxParser, PayloadDecoder, PostRenderer
+
+import synthetic
+
+
+CHUNK = 64 * 1024
+BASELINE = path.join(path.dirname(path.abspath(__file__)), 'baseline.json')
+
+
+def chunked(data):
+    return [data[i:i + CHUNK] for i in range(0, len(data), CHUNK)]
+
+
+def run_tape(data):
+    tape = Tape()
+    for chunk in chunked(data):
+        tape.write(chunk)
+        while len(tape):
+            tape.read()
+
+
+def run_decode(data):
+    decoded = []
+    decoder = PayloadDecoder(decoded.append, text=False)
+    for chunk in chunked(data):
+        decoder.feed(chunk)
+    decoder.close()
+
+
+def run_json(backend):
+    def run(data):
+        streamer = JSONStreamer(backend)
+        for chunk in chunked(data):
+            streamer.consume(chunk)
+        streamer.close()
+    return run
+
+
+def run_sax(data):
+    parser = JsonSaxParser(StringIO(), PostRenderer(synthetic.PLAYERID, False))
+    for chunk in chunked(data):
+        parser.parse(chunk)
+    parser.close()
+
+
+def run_page(parser_class):
+    def run(data):
+        parser = parser_class(StringIO(), synthetic.PLAYERID, False)
+        for chunk in chunked(data):
+            parser.process(chunk)
+        parser.finalize()
+    return run
+
+
+def stages(page):
+    """name -> (function, its input)"""
+    # the payload as it is on the page and decoded
+    encoded = page[page.index(b'msgdata = "') + len(b'msgdata = "'):]
+    encoded = encoded[:encoded.index(b'"')]
+    decoded = []
+    decoder = PayloadDecoder(decoded.append, text=False)
+    decoder.feed(encoded)
+    decoder.close()
+    decoded = b''.join(bytes(chunk) for chunk in decoded)
+
+    result = {
+        'tape': (run_tape, decoded),
+        'decode': (run_decode, encoded),
+        }
+    for backend in sorted(BACKENDS):
+        if backend != 'yajl' or yajl is not None:
+            result['json-{}'.format(backend)] = (run_json(backend), decoded)
+    result['sax'] = (run_sax, decoded)
+    result['streamed'] = (run_page(ChatParser), page)
+    result['buffered'] = (run_page(BufferedChatParser), page)
+    return result
+
+
+def measure(function, data, posts, repeat):
+    elapsed = None
+    # like timeit, keep the garbage collector from kicking in at random
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = perf_counter()
+            function(data)
+            elapsed = min(elapsed or float('inf'), perf_counter() - start)
+    finally:
+        gc.enable()
+    tracemalloc.start()
+    function(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'mb_s': len(data) / elapsed / 1e6,
+        'posts_s': posts / elapsed,
+        'peak_mb': peak / 1e6,
+        }
+
+
+def compare(result, baseline, tolerance):
+    # returns what got worse, if anything
+    worse = []
+    if baseline['mb_s'] and result['mb_s'] < baseline['mb_s'] * (1 - tolerance):
+        worse.append('{:.0%} slower'.format(1 - result['mb_s'] / baseline['mb_s']))
+    if baseline['peak_mb'] and result['peak_mb'] > baseline['peak_mb'] * (1 + tolerance):
+        worse.append('{:.0%} more memory'.format(result['peak_mb'] / baseline['peak_mb'] - 1))
+    return worse
+
+
+def main():
+    arguments = ArgumentParser(description=__doc__.split('\n\n')[0])
+    arguments.add_argument('--posts', type=int, default=20000, help='posts on the page (default 20000)')
+    arguments.add_argument('--seed', type=int, default=0)
+    arguments.add_argument('--repeat', type=int, default=5, help='runs per stage, the best one counts (default 5)')
+    arguments.add_argument('--baseline', default=BASELINE, help='where the baseline is kept (default benchmarks/baseline.json)')
+    arguments.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    arguments.add_argument('--tolerance', type=float, default=0.15, help='how much worse a stage may get (default 0.15)')
+    options = arguments.parse_args()
+
+    page = synthetic.make_page(options.posts, seed=options.seed)
+    setup = {'posts': options.posts, 'seed': options.seed, 'bytes': len(page)}
+    print('{} posts, {:.1f} MB page'.format(options.posts, len(page) / 1e6))
+
+    baseline = None
+    if not options.save and path.exists(options.baseline):
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['setup'] != setup:
+            print('baseline is for a different page ({}), not comparing'.format(baseline['setup']))
+            baseline = None
+
+    results = {}
+    regressions = 0
+    for name, (function, data) in stages(page).items():
+        result = results[name] = measure(function, data, options.posts, options.repeat)
+        line = '{:>14}: {:8.1f} MB/s {:10.0f} posts/s {:8.1f} MB peak'.format(
+                name, result['mb_s'], result['posts_s'], result['peak_mb'])
+        if baseline is not None and name in baseline['stages']:
+            before = baseline['stages'][name]
+            line += '  (x{:.2f} speed vs baseline)'.format(result['mb_s'] / before['mb_s'])
+            worse = compare(result, before, options.tolerance)
+            if worse:
+                regressions += 1
+                line += '  REGRESSION: {}'.format(', '.join(worse))
+        print(line)
+
+    if options.save:
+        with open(options.baseline, 'w') as baseline_file:
+            json.dump({'setup': setup, 'stages': results}, baseline_file, indent=4)
+        print('saved as the baseline in {}'.format(options.baseline))
+    elif regressions:
+        print('{} stage(s) regressed'.format(regressions))
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Throughput of the streaming (SAX) msgdata parser, in JSON tokens per second.
+
+Feeds a decoded msgdata payload to JsonSaxParser in 64 KiB chunks, the way
+ChatParser does, and prints the best of a few runs. The payload is either a
+page out of the page cache (any objects/*.json.gz under cache_dir) or, by
+default, a synthetic one (see synthetic.py) a few megabytes big, heavy on
+inline rolls like a real game.
+
+    python benchmarks/sax.py [payload.json.gz | posts]
+"""
+import gzip
+from io import StringIO
+from os import path
+from sys import argv, path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from jsonstreamer import JSONStreamer
+from parsers import JsonSaxParser, PostRenderer
+
+from synthetic import PLAYERID, make_payload
+
+
+CHUNK = 64 * 1024
+
+
+def count_tokens(payload):
+    tokens = 0
+
+    def count(event, *args):
+        nonlocal tokens
+        tokens += 1
+
+    streamer = JSONStreamer()
+    streamer.add_catch_all_listener(count)
+    streamer.consume(payload)
+    streamer.close()
+    # doc start and doc end aren't tokens
+    return tokens - 2
+
+
+def parse(payload):
+    parser = JsonSaxParser(StringIO(), PostRenderer(PLAYERID, False))
+    start = perf_counter()
+    for i in range(0, len(payload), CHUNK):
+        parser.parse(payload[i:i + CHUNK])
+    parser.close()
+    return perf_counter() - start
+
+
+def main():
+    if len(argv) > 1 and not argv[1].isdigit():
+        with gzip.open(argv[1]) as payload_file:
+            payload = payload_file.read()
+    else:
+        payload = make_payload(int(argv[1]) if len(argv) > 1 else 20000, inlinerolls=1.5)
+    tokens = count_tokens(payload)
+    print('{:.1f} MB, {} tokens'.format(len(payload) / 1e6, tokens))
+    elapsed = min(parse(payload) for _ in range(3))
+    print('{:.3f}s, {:.2f}M tokens/s, {:.1f} MB/s'.format(elapsed, tokens / elapsed / 1e6, len(payload) / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Synthetic Roll20 chat archive pages, for the benchmarks.
+
+Pages are laid out like the real thing: a pile of markup, the window
+properties ArchiveMetadata looks for, then the posts as a base64 msgdata
+payload. Posts come in every type the parsers deal with, in whatever mix
+is asked for: rolls, GM rolls, whispers to one or more players, chat with
+inline rolls, token selections, and names and text with multi-byte UTF-8
+in them. The same arguments always give the same page.
+
+    python benchmarks/synthetic.py [posts] > page.html
+"""
+import json
+from base64 import b64encode
+from random import Random
+from sys import argv, stdout
+
+
+PLAYERID = '-Mbench'
+OTHERS = ['-Mother1', '-Mother2', '-Mother3']
+
+NAMES = ['Player {}', 'Gérard {}', 'Ōkami {}', 'Snowman ☃ {}', 'Дмитрий {}']
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'the', 'goblin', 'swings', 'at', 'you']
+UNICODE_WORDS = ['ünïcödé', 'façade', 'naïve', '日本語', 'καλημέρα', '🎲', '⚔️', 'Ωmega']
+
+
+def _count(random, mean):
+    # somewhere between none and twice the mean, the mean on average
+    return random.randint(0, round(2 * mean))
+
+
+def _text(random, words, unicode):
+    pool = WORDS + UNICODE_WORDS if random.random() < unicode else WORDS
+    return ' '.join(random.choice(pool) for _ in range(words))
+
+
+def make_posts(posts, seed=0, rolls=0.25, gm_rolls=0.05, whispers=0.1, inlinerolls=1.0, unicode=0.2, first_id=0):
+    """
+    The msgdata of a page, as a dict of post ID -> post. rolls, gm_rolls and
+    whispers are the share of posts of each kind, inlinerolls how many inline
+    rolls chat posts have on average and unicode the share of posts with
+    multi-byte characters. Post IDs count up from first_id, so they sort
+    chronologically like the real ones.
+    """
+    random = Random(seed)
+    msgdata = {}
+    for i in range(posts):
+        speaker = i % 7
+        post = {
+            'who': random.choice(NAMES).format(speaker) if random.random() < unicode else 'Player {}'.format(speaker),
+            'playerid': PLAYERID if speaker == 0 else OTHERS[speaker % len(OTHERS)],
+            'avatar': '/users/avatar/{}/30'.format(speaker),
+            }
+        kind = random.random()
+        if kind < rolls + gm_rolls:
+            post['type'] = 'rollresult' if kind < rolls else 'gmrollresult'
+            dice = random.randint(1, 4)
+            post['origRoll'] = '{}d20+{}'.format(dice, i % 7)
+            results = [{'v': random.randint(1, 20)} for _ in range(dice)]
+            post['content'] = json.dumps({
+                'type': 'V',
+                'rolls': [{'type': 'R', 'dice': dice, 'sides': 20, 'mods': {}, 'results': results}, {'type': 'M', 'expr': '+{}'.format(i % 7)}],
+                'resultType': 'sum',
+                'total': sum(result['v'] for result in results) + i % 7,
+                })
+            post['signature'] = '{:0128x}'.format(random.getrandbits(512))
+            post['tdseed'] = random.getrandbits(32)
+        else:
+            if kind < rolls + gm_rolls + whispers:
+                post['type'] = 'whisper'
+                post['target'] = ','.join(random.sample([PLAYERID] + OTHERS, random.randint(1, 2)))
+                post['target_name'] = 'Someone'
+            else:
+                post['type'] = random.choice(['general', 'general', 'general', 'emote', 'desc'])
+            count = _count(random, inlinerolls)
+            parts = [_text(random, random.randint(1, 30), unicode)]
+            for n in range(count):
+                parts.append('$[[{}]]'.format(n))
+                parts.append(_text(random, random.randint(0, 8), unicode))
+            post['content'] = ' '.join(parts)
+            if count:
+                post['inlinerolls'] = []
+                for n in range(count):
+                    v = random.randint(1, 8)
+                    post['inlinerolls'].append({
+                        'expression': '1d8+{}'.format(n),
+                        'results': {
+                            'type': 'V',
+                            'rolls': [{'type': 'R', 'dice': 1, 'sides': 8, 'results': [{'v': v}]}, {'type': 'M', 'expr': '+{}'.format(n)}],
+                            'resultType': 'sum',
+                            'total': v + n,
+                            },
+                        'rollid': '-M{:019d}'.format(random.getrandbits(60)),
+                        'signature': '{:0128x}'.format(random.getrandbits(512)),
+                        })
+            if random.random() < 0.1:
+                post['selected'] = [{'_id': '-Mtoken{}'.format(n), '_type': 'graphic'} for n in range(random.randint(1, 3))]
+        msgdata['-M{:010d}'.format(first_id + i)] = post
+    return msgdata
+
+
+def make_payload(posts, **kwargs):
+    """The decoded msgdata of a page, as ChatParser hands it to the JSON parser."""
+    return json.dumps(make_posts(posts, **kwargs), ensure_ascii=False).encode()
+
+
+def make_page(posts, pages=1, is_gm=False, **kwargs):
+    """A whole chat archive page, posts as in make_posts()."""
+    payload = b64encode(make_payload(posts, **kwargs))
+    nav = ''.join('<li><a href="/campaigns/details/{0}">Campaign {0}</a></li>\n'.format(n) for n in range(200))
+    head = '\n'.join([
+        '<!DOCTYPE html>',
+        '<html><head><title>Chat Archive | Roll20</title></head><body>',
+        '<ul class="nav">', nav, '</ul>',
+        '<div class="pagination"><div>Page 1/{}</div></div>'.format(pages),
+        '<script type="text/javascript">',
+        'Object.defineProperty(window, "currentPlayer", {{value: {{id: "{}"}}, writable: false }});'.format(PLAYERID),
+        'Object.defineProperty(window, "is_gm", { value : true, writable : false });' if is_gm else '',
+        '  var msgdata = "',
+        ])
+    tail = '";\n</script>\n' + '<div class="footer"></div>\n' * 100 + '</body></html>\n'
+    return head.encode() + payload + tail.encode()
+
+
+if __name__ == '__main__':
+    stdout.buffer.write(make_page(int(argv[1]) if len(argv) > 1 else 1000))
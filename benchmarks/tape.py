@@ -0,0 +1,86 @@
+"""
+The jsonstreamer Tape against the one it replaced, which kept a str and
+sliced what was read off its front, copying whatever was left every time.
+
+Two ways of using it, both reading 64 KiB at a time like the JSON backends:
+
+- streamed: 64 KiB written, then read back out, over and over, the way
+  ChatParser feeds a download to JSONStreamer
+- whole: the whole payload written at once, then read back out, the way
+  JSONStreamer.consume() gets a page that was in memory already
+
+The old tape gets the payload as str, as it did back then. Prints MB/s of
+each tape and how many times faster the new one is, best of a few runs.
+
+    python benchmarks/tape.py [posts]
+"""
+from os import path
+from sys import argv, path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from jsonstreamer.tape import Tape
+
+from synthetic import make_payload
+
+
+CHUNK = 64 * 1024
+
+
+class OldTape:
+    """Tape as it was before it went over to bytes, for comparison."""
+
+    def __init__(self, initial_value=''):
+        self._buffer = initial_value
+
+    def read(self, size=None):
+        if size:
+            result = self._buffer[0:size]
+            self._buffer = self._buffer[size:]
+            return result
+        else:
+            result = self._buffer
+            self._buffer = ''
+            return result
+
+    def write(self, s):
+        self._buffer += s
+        return len(s)
+
+    def __len__(self):
+        return len(self._buffer)
+
+
+def streamed(tape_class, payload):
+    tape = tape_class()
+    start = perf_counter()
+    for i in range(0, len(payload), CHUNK):
+        tape.write(payload[i:i + CHUNK])
+        while len(tape):
+            tape.read(CHUNK)
+    return perf_counter() - start
+
+
+def whole(tape_class, payload):
+    tape = tape_class()
+    start = perf_counter()
+    tape.write(payload)
+    while len(tape):
+        tape.read(CHUNK)
+    return perf_counter() - start
+
+
+def main():
+    payload = make_payload(int(argv[1]) if len(argv) > 1 else 20000)
+    text = payload.decode()
+    print('{:.1f} MB payload'.format(len(payload) / 1e6))
+    for run in (streamed, whole):
+        old = min(run(OldTape, text) for _ in range(3))
+        new = min(run(Tape, payload) for _ in range(3))
+        print('{:>9}: old {:10.1f} MB/s, new {:10.1f} MB/s, x{:.1f}'.format(
+            run.__name__, len(payload) / old / 1e6, len(payload) / new / 1e6, old / new))
+
+
+if __name__ == '__main__':
+    main()
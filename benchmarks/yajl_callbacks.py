@@ -0,0 +1,143 @@
+"""
+Callbacks per second through the yajl backend: a decoded msgdata payload fed
+to YajlParser in 64 KiB chunks with a listener that does nothing, so what's
+left is yajl itself and the Python callbacks it makes for every token. Then
+the same through JSONStreamer, which is what the chatlog parser sits on.
+
+The callbacks are counted once beforehand with the stdlib backend, which
+makes the same ones. Needs the yajl shared library: without it there's
+nothing to measure. Prints the best of a few runs.
+
+    python benchmarks/yajl_callbacks.py [posts]
+"""
+from os import path
+from sys import argv, exit, path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from jsonstreamer import JSONStreamer
+from jsonstreamer.stdlib.parse import StdlibParser
+from jsonstreamer.tape import Tape
+from jsonstreamer.yajl.parse import YajlListener, YajlParser, yajl
+
+from synthetic import make_payload
+
+
+CHUNK = 64 * 1024
+
+
+class NoOp(YajlListener):
+
+    def on_null(self, ctx):
+        pass
+
+    def on_boolean(self, ctx, boolVal):
+        pass
+
+    def on_integer(self, ctx, integerVal):
+        pass
+
+    def on_double(self, ctx, doubleVal):
+        pass
+
+    def on_string(self, ctx, stringVal):
+        pass
+
+    def on_start_map(self, ctx):
+        pass
+
+    def on_map_key(self, ctx, stringVal):
+        pass
+
+    def on_end_map(self, ctx):
+        pass
+
+    def on_start_array(self, ctx):
+        pass
+
+    def on_end_array(self, ctx):
+        pass
+
+
+class Counter(YajlListener):
+
+    def __init__(self):
+        self.callbacks = 0
+
+    def on_null(self, ctx):
+        self.callbacks += 1
+
+    def on_boolean(self, ctx, boolVal):
+        self.callbacks += 1
+
+    def on_integer(self, ctx, integerVal):
+        self.callbacks += 1
+
+    def on_double(self, ctx, doubleVal):
+        self.callbacks += 1
+
+    def on_string(self, ctx, stringVal):
+        self.callbacks += 1
+
+    def on_start_map(self, ctx):
+        self.callbacks += 1
+
+    def on_map_key(self, ctx, stringVal):
+        self.callbacks += 1
+
+    def on_end_map(self, ctx):
+        self.callbacks += 1
+
+    def on_start_array(self, ctx):
+        self.callbacks += 1
+
+    def on_end_array(self, ctx):
+        self.callbacks += 1
+
+
+def count_callbacks(payload):
+    counter = Counter()
+    parser = StdlibParser(counter)
+    tape = Tape(payload)
+    parser.parse(tape)
+    parser.close()
+    return counter.callbacks
+
+
+def parse(payload):
+    parser = YajlParser(NoOp())
+    tape = Tape()
+    start = perf_counter()
+    for i in range(0, len(payload), CHUNK):
+        tape.write(payload[i:i + CHUNK])
+        parser.parse(tape)
+    elapsed = perf_counter() - start
+    parser.close()
+    return elapsed
+
+
+def stream(payload):
+    streamer = JSONStreamer('yajl')
+    start = perf_counter()
+    for i in range(0, len(payload), CHUNK):
+        streamer.consume(payload[i:i + CHUNK])
+    streamer.close()
+    return perf_counter() - start
+
+
+def main():
+    payload = make_payload(int(argv[1]) if len(argv) > 1 else 20000)
+    callbacks = count_callbacks(payload)
+    print('{:.1f} MB, {} callbacks'.format(len(payload) / 1e6, callbacks))
+    if yajl is None:
+        print('yajl could not be loaded, nothing to measure')
+        exit(1)
+    for run in (parse, stream):
+        elapsed = min(run(payload) for _ in range(3))
+        print('{:>6}: {:.3f}s, {:.2f}M callbacks/s, {:.1f} MB/s'.format(
+            run.__name__, elapsed, callbacks / elapsed / 1e6, len(payload) / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
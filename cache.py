@@ -0,0 +1,182 @@
+from hashlib import sha256
+from os import listdir, makedirs, path, remove, replace
+from tempfile import mkstemp
+import zlib
+
+import profiler
+
+
+class CacheWriter:
+    """
+    Takes the decoded msgdata JSON of one page as it comes, gzipping it into
+    the cache on the fly. close() files it under its SHA-256 and returns that,
+    abort() throws it away if the page doesn't make it.
+    The file is only created on the first write, so writers can be handed to
+    worker processes.
+    """
+
+    def __init__(self, objects_dir):
+        self._objects_dir = objects_dir
+        self._file = None
+
+
+    def _open(self):
+        fd, self._tmp_filepath = mkstemp(dir=self._objects_dir, suffix='.tmp')
+        self._file = open(fd, 'wb')
+        self._hash = sha256()
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+    def write(self, data):
+        if not profiler.enabled:
+            self._write(data)
+            return
+        start = profiler.enter()
+        try:
+            self._write(data)
+        finally:
+            profiler.leave('cache', start, len(data))
+
+
+    def _write(self, data):
+        if self._file is None:
+            self._open()
+        self._hash.update(data)
+        self._file.write(self._compressor.compress(data))
+
+
+    def close(self):
+        if self._file is None:
+            self._open()
+        self._file.write(self._compressor.flush())
+        self._file.close()
+        digest = self._hash.hexdigest()
+        object_filepath = '{}/{}.json.gz'.format(self._objects_dir, digest)
+        if path.exists(object_filepath):
+            remove(self._tmp_filepath)
+        else:
+            replace(self._tmp_filepath, object_filepath)
+        return digest
+
+
+    def abort(self):
+        if self._file is None:
+            return
+        self._file.close()
+        try:
+            remove(self._tmp_filepath)
+        except FileNotFoundError:
+            pass
+        self._file = None
+
+
+class PendingIndex:
+    """
+    Digests of the pages cached so far by an export, kept in a file next to
+    its checkpoint so that a resumed export still knows about the pages it
+    doesn't download again. Same deal as Checkpoint: one line per page,
+    appended as it's done.
+    """
+
+    def __init__(self, filepath, keep):
+        # page -> digest, for the pages in keep(page, digest)
+        self.digests = {}
+        try:
+            with open(filepath) as pending_file:
+                for line in pending_file:
+                    if line.endswith('\n'):
+                        page, _, digest = line[:-1].partition(' ')
+                        if keep(int(page), digest):
+                            self.digests[int(page)] = digest
+        except FileNotFoundError:
+            pass
+        self._file = open(filepath, 'w')
+        for page, digest in sorted(self.digests.items()):
+            self._file.write('{} {}\n'.format(page, digest))
+        self._file.flush()
+
+
+    def add(self, page, digest):
+        self.digests[page] = digest
+        self._file.write('{} {}\n'.format(page, digest))
+        self._file.flush()
+
+
+    def close(self):
+        self._file.close()
+
+
+class PageCache:
+    """
+    The decoded msgdata of every chatlog page, so chatlogs can be rendered
+    again without downloading them.
+
+    Pages are stored gzipped under objects/, named by the SHA-256 of their
+    contents: a page that didn't change since the last export is stored only
+    once. Each campaign then has an index listing which object holds which
+    page, along with what it takes to render them: the page count, the ID
+    of the player who downloaded them and whether they are GM.
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._objects_dir = '{}/objects'.format(directory)
+        makedirs(self._objects_dir, exist_ok=True)
+
+
+    def writer(self):
+        return CacheWriter(self._objects_dir)
+
+
+    def has(self, digest):
+        return path.exists('{}/{}.json.gz'.format(self._objects_dir, digest))
+
+
+    def read(self, digest):
+        with open('{}/{}.json.gz'.format(self._objects_dir, digest), 'rb') as object_file:
+            return zlib.decompress(object_file.read(), 16 + zlib.MAX_WBITS)
+
+
+    def _index_filepath(self, campaign_id):
+        return '{}/{}.index'.format(self._directory, campaign_id)
+
+
+    def save_index(self, campaign_id, pages, playerid, is_gm, digests):
+        index_filepath = self._index_filepath(campaign_id)
+        with open(index_filepath + '.tmp', 'w') as index_file:
+            index_file.write('pages {}\nplayerid {}\nis_gm {}\n'.format(pages, playerid, int(is_gm)))
+            for page in range(1, pages + 1):
+                index_file.write('{} {}\n'.format(page, digests[page]))
+        replace(index_filepath + '.tmp', index_filepath)
+
+
+    def load_index(self, campaign_id):
+        """Returns pages, playerid, is_gm and page -> digest, or None if there's no index."""
+        try:
+            with open(self._index_filepath(campaign_id)) as index_file:
+                pages = int(index_file.readline().split(' ', 1)[1])
+                playerid = index_file.readline()[:-1].split(' ', 1)[1]
+                is_gm = index_file.readline()[:-1].split(' ', 1)[1] == '1'
+                digests = {}
+                for line in index_file:
+                    page, _, digest = line[:-1].partition(' ')
+                    digests[int(page)] = digest
+        except FileNotFoundError:
+            return None
+        return pages, playerid, is_gm, digests
+
+
+    def prune(self):
+        """
+        Drops the objects no index points to anymore, and whatever a crash
+        left half written. Exports still running have objects that aren't in
+        any index yet, so only call this when there are none.
+        """
+        wanted = set()
+        for filename in listdir(self._directory):
+            if filename.endswith('.index'):
+                wanted.update(self.load_index(filename[:-len('.index')])[3].values())
+        for filename in listdir(self._objects_dir):
+            if filename.endswith('.tmp') \
+                    or filename.endswith('.json.gz') and filename[:-len('.json.gz')] not in wanted:
+                remove('{}/{}'.format(self._objects_dir, filename))
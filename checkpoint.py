@@ -0,0 +1,71 @@
+from os import remove
+
+
+class Checkpoint:
+    """
+    Manifest of the chatlog pages already saved to disk, so an interrupted
+    export can pick up where it left off instead of starting over.
+
+    The manifest is a plain text file: a header with the page count it refers
+    to, then one line per page, appended as soon as the page is on disk, with
+    its number, the ID of the newest post in it and, if it made it into the
+    output file, the size of the file right after it. If the page count
+    changed in the meantime the pages have likely shifted, so the old
+    manifest is thrown away.
+    """
+
+    def __init__(self, filepath, pages):
+        self._filepath = filepath
+        self._header = 'pages {}\n'.format(pages)
+        # page -> newest post ID in it, if any
+        self.done = {}
+        # page -> output file size after it, for the pages already in there
+        self.offsets = {}
+        try:
+            with open(filepath) as manifest:
+                if manifest.readline() == self._header:
+                    for line in manifest:
+                        # a line cut short by a crash has no newline yet: skip it
+                        if line.endswith('\n'):
+                            page, newest_id, offset = (line[:-1].split(' ') + [''])[:3]
+                            self._record(int(page), newest_id or None, int(offset) if offset else None)
+        except FileNotFoundError:
+            pass
+
+
+    def _record(self, page, newest_id, offset):
+        self.done[page] = newest_id
+        if offset is None:
+            self.offsets.pop(page, None)
+        else:
+            self.offsets[page] = offset
+
+
+    def open(self, keep):
+        """Starts a fresh manifest holding only the pages in keep."""
+        self.done = {page: newest_id for page, newest_id in self.done.items() if keep(page)}
+        self.offsets = {page: offset for page, offset in self.offsets.items() if page in self.done}
+        self._file = open(self._filepath, 'w')
+        self._file.write(self._header)
+        for page, newest_id in sorted(self.done.items()):
+            self._write(page, newest_id, self.offsets.get(page))
+        self._file.flush()
+
+
+    def add(self, page, newest_id=None, offset=None):
+        self._record(page, newest_id, offset)
+        self._write(page, newest_id, offset)
+        self._file.flush()
+
+
+    def _write(self, page, newest_id, offset):
+        self._file.write('{} {} {}\n'.format(page, newest_id or '', '' if offset is None else offset))
+
+
+    def close(self):
+        self._file.close()
+
+
+    def remove(self):
+        self.close()
+        remove(self._filepath)
@@ -1,11 +1,12 @@
 import asyncio
 from os import path, mkdir
 from datetime import date
-from sys import exc_info, stderr
+from sys import argv, exc_info, stderr
 from traceback import print_exception
 from logging import getLogger, INFO
 
 import config
+import profiler
 import roll20
 
 import time
@@ -13,35 +14,85 @@ import time
 
 outputdir = 'output'
 
+async def dump_campaign(section, incremental):
+    print('Accessing chatlog for {}...'.format(section))
+    campaign_id = config.options[section]['id']
+    since = None
+    if incremental and config.watermarks.has_section(campaign_id):
+        since = config.watermarks[campaign_id]['newest']
+    if since is None:
+        filepath = '{}/{}_{}.txt'.format(outputdir, section, date.today())
+    else:
+        # only the posts after since: named after it, so that it can't take
+        # the place of a whole chatlog or of whatever came before it
+        filepath = '{}/{}_{}_since_{}.txt'.format(outputdir, section, date.today(), since)
+    newest, new_posts = await roll20.dump_chatlog(
+            campaign_id,
+            filepath,
+            since,
+            section
+            )
+    if newest is not None:
+        if not config.watermarks.has_section(campaign_id):
+            config.watermarks.add_section(campaign_id)
+        config.watermarks[campaign_id]['newest'] = newest
+        config.save_watermarks()
+    if since is not None and not new_posts:
+        print('{}: no new messages since the last run.'.format(section))
+    else:
+        print('{}: successfully saved to file "{}".'.format(section, filepath))
+
+
+def render_campaign(section):
+    print('Rendering chatlog for {} from the cache...'.format(section))
+    campaign_id = config.options[section]['id']
+    filepath = ('{}/{}_{}.txt'.format(outputdir, section, date.today()))
+    roll20.render_cached_chatlog(campaign_id, filepath, section)
+    print('{}: successfully saved to file "{}".'.format(section, filepath))
+
+
 async def main():
     try:
         print('r20chronicler build 2020-12-13')
+        if '--profile' in argv[1:]:
+            profiler.enable()
         config.load()
-        await roll20.new_session(
-            config.options['user']['email'],
-            config.options['user']['password']
-            )
+        config.load_watermarks()
+        roll20.configure(config.options['options'])
+        incremental = config.options['options'].getboolean('incremental')
         try:
             mkdir('output')
         except FileExistsError:
             pass
-        for section in config.options:
-            if section == 'DEFAULT' or section == 'user':
-                continue
-            
-            print('Accessing chatlog for {}...'.format(section))
-            filepath = ('{}/{}_{}.txt'.format(outputdir, section, date.today()))
-            await roll20.dump_chatlog(
-                    config.options[section]['id'],
-                    filepath
-                    )
-            print('Successfully saved to file "{}".'.format(filepath))
+        campaigns = [
+            section for section in config.options
+            if section not in ('DEFAULT', 'user', 'options')
+            ]
+        if '--from-cache' in argv[1:]:
+            # no need to even log in
+            for section in campaigns:
+                render_campaign(section)
+        else:
+            await roll20.new_session(
+                config.options['user']['email'],
+                config.options['user']['password']
+                )
+            # all campaigns at once: roll20 keeps the number of requests in
+            # flight in check across all of them
+            exports = [asyncio.ensure_future(dump_campaign(section, incremental)) for section in campaigns]
+            try:
+                await asyncio.gather(*exports)
+            except:
+                for export in exports:
+                    export.cancel()
+                raise
+            roll20.prune_cache()
     except roll20.HTTPError as e:
         if e.status == 302:
             roll20.delete_cookiejar()
         else:
             stderr.write('ERROR: {}\n'.format(e.message))
-    except roll20.LoginError as e:
+    except (roll20.LoginError, roll20.CacheMissError, roll20.DuplicateExportError) as e:
         stderr.write('ERROR: {}\n'.format(e.message))
     except:
         stderr.write('ERROR\n')
@@ -51,11 +102,17 @@ async def main():
         print('DONE')
     finally:
         await roll20.close_session()
+        if profiler.enabled:
+            report_filepath = '{}/profile_{}.json'.format(outputdir, date.today())
+            print(profiler.summary(profiler.save(report_filepath)))
+            print('Profile saved to file "{}".'.format(report_filepath))
         print('Press Enter to close.')
         input()
 
 
 if __name__ == '__main__':
-        getLogger('asyncio').setLevel(INFO)
+        # again turns on DEBUG logging for everything as soon as it's imported
+        for logger in ('asyncio', 'roll20', 'scheduler'):
+            getLogger(logger).setLevel(INFO)
         loop = asyncio.get_event_loop()
         loop.run_until_complete(main())
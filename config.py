@@ -1,12 +1,51 @@
 import configparser
 
 options = configparser.ConfigParser()
+# newest post saved so far for each campaign, by campaign id
+watermarks = configparser.ConfigParser()
+
+# anything in here can be left out of config.ini
+defaults = {
+    'options': {
+        'buffered_page_limit': str(8 * 1024 * 1024),
+        'initial_concurrency': '4',
+        'min_concurrency': '1',
+        'max_concurrency': '16',
+        'latency_tolerance': '2.0',
+        'max_retries': '5',
+        'retry_base_delay': '1.0',
+        'retry_max_delay': '60.0',
+        'incremental': 'no',
+        'connection_limit': '16',
+        'keepalive_timeout': '30.0',
+        'dns_cache_ttl': '300',
+        'compression': 'yes',
+        'parse_workers': '0',
+        'parse_backlog': '2',
+        'reorder_budget': str(32 * 1024 * 1024),
+        'cache': 'no',
+        'cache_dir': 'cache',
+        'database': '',
+        'archive_dir': '',
+        'base_url': 'https://app.roll20.net',
+        },
+    }
 
 def load():
     global options
+    options.read_dict(defaults)
     options.read('config.ini')
 
 def save():
     global options
     with open('config.ini', 'w') as config_file:
         options.write(config_file)
+
+def load_watermarks():
+    global watermarks
+    watermarks.read('watermarks.ini')
+
+def save_watermarks():
+    global watermarks
+    with open('watermarks.ini', 'w') as watermarks_file:
+        watermarks.write(watermarks_file)
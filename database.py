@@ -0,0 +1,90 @@
+from logging import getLogger
+import sqlite3
+
+import profiler
+
+
+logger = getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS posts (
+    campaign TEXT NOT NULL,
+    id TEXT NOT NULL,
+    type TEXT,
+    who TEXT,
+    playerid TEXT,
+    target TEXT,
+    content TEXT,
+    roll_total NUMERIC,
+    UNIQUE (campaign, id)
+);
+CREATE INDEX IF NOT EXISTS posts_who ON posts (who);
+'''
+
+# not every SQLite out there comes with FTS5
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5 (
+    content,
+    content = 'posts',
+    content_rowid = 'rowid'
+);
+'''
+
+
+class PostDatabase:
+    """
+    Every post saved, in a SQLite database with a full-text index on their
+    content, for when grepping the chatlogs gets old:
+
+        SELECT who, content FROM posts_fts JOIN posts ON posts.rowid = posts_fts.rowid
+        WHERE posts_fts MATCH 'dragon' ORDER BY id;
+
+    Posts come in a page's worth at a time, each page in one transaction.
+    Downloading a chatlog again only adds the posts that weren't there yet.
+    The full-text index is fed a page at a time too, straight from the new
+    rows: a trigger doing it one post at a time is several times slower.
+    """
+
+    def __init__(self, filepath):
+        self._connection = sqlite3.connect(filepath)
+        # losing the last few pages to a power cut is fine: they'll be
+        # downloaded again anyway
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.execute('PRAGMA synchronous = NORMAL')
+        self._connection.executescript(SCHEMA)
+        try:
+            self._connection.executescript(FTS_SCHEMA)
+            self._fts = True
+        except sqlite3.OperationalError as e:
+            logger.warning('No full-text index for %s: %s', filepath, e)
+            self._fts = False
+
+
+    def add(self, campaign_id, rows):
+        """Adds rows as kept by parsers.PostRenderer."""
+        if not profiler.enabled:
+            self._add(campaign_id, rows)
+            return
+        start = profiler.enter()
+        try:
+            self._add(campaign_id, rows)
+        finally:
+            profiler.leave('database', start, messages=len(rows))
+
+
+    def _add(self, campaign_id, rows):
+        with self._connection:
+            last_rowid = self._connection.execute('SELECT max(rowid) FROM posts').fetchone()[0] or 0
+            self._connection.executemany(
+                    'INSERT OR IGNORE INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    ((campaign_id,) + row for row in rows)
+                    )
+            if self._fts:
+                self._connection.execute(
+                        'INSERT INTO posts_fts (rowid, content) SELECT rowid, content FROM posts WHERE rowid > ?',
+                        (last_rowid,)
+                        )
+
+
+    def close(self):
+        self._connection.close()
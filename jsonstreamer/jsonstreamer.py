@@ -7,16 +7,24 @@ again -> https://github.com/kashifrazzaqui/again#eventing-boilerplate
 """
 
 from enum import Enum
+from functools import partial
 from sys import stdin, stdout
 
 from again import events
 
-from .yajl.parse import YajlParser, YajlListener, YajlError
+from .yajl.parse import YajlParser, YajlListener, YajlError, yajl
+from .stdlib.parse import StdlibParser, StdlibError
 from .tape import Tape
 
 JSONLiteralType = Enum('JSONValueType', 'STRING NUMBER BOOLEAN NULL')
 JSONCompositeType = Enum('JSONCompositeType', 'OBJECT ARRAY')
 
+# parser backends share YajlParser's interface: constructed with a YajlListener, then fed a Tape through parse()
+# and released with close(). yajl is preferred whenever the shared library can be loaded; benchmarks/backends.py
+# shows how the two compare at different page sizes
+BACKENDS = {'yajl': YajlParser, 'stdlib': StdlibParser}
+DEFAULT_BACKEND = 'yajl' if yajl is not None else 'stdlib'
+
 
 class JSONStreamerException(Exception):
     def __init__(self, msg):
@@ -69,13 +77,67 @@ class JSONStreamer(events.EventSource, YajlListener):
     VALUE_EVENT = 'value'
     ELEMENT_EVENT = 'element'
 
-    def __init__(self):
+    # EventSource keeps its listeners in the instance __dict__ all the same, but what's touched on every token is
+    # in slots
+    __slots__ = ('_file_like', '_stack', '_pending_value', '_started', '_parser', '_handlers')
+
+    def __init__(self, backend=None):
+        """
+        Args:
+            backend (str): name of the parser backend to use, one of `BACKENDS`. Defaults to `DEFAULT_BACKEND`
+        """
         super(JSONStreamer, self).__init__()
         self._file_like = Tape()
         self._stack = []
         self._pending_value = False
         self._started = False
-        self._parser = YajlParser(self)
+        self._parser = BACKENDS[backend or DEFAULT_BACKEND](self)
+        # event -> everything to call for it, worked out on its first fire()
+        self._handlers = {}
+
+    def fire(self, event, *args):
+        """Same as EventSource.fire, without looking up the listeners again on every token"""
+        handlers = self._handlers.get(event)
+        if handlers is None:
+            handlers = self._handlers[event] = self._resolve(event)
+        for handler in handlers:
+            handler(*args)
+
+    def _resolve(self, event):
+        # same order as EventSource.fire: listeners, observers, catch-alls
+        handlers = list(self.get_listeners(event))
+        for observer, prefix in self._observers.items():
+            listener = getattr(observer, prefix + str(event).lower(), False)
+            if listener and callable(listener):
+                handlers.append(listener)
+        handlers.extend(partial(listener, event) for listener in self.get_catch_all_listeners())
+        return tuple(handlers)
+
+    # any change to the listeners invalidates what fire() worked out
+
+    def add_listener(self, event, listener):
+        self._handlers.clear()
+        super(JSONStreamer, self).add_listener(event, listener)
+
+    def remove_listener(self, event, listener):
+        self._handlers.clear()
+        super(JSONStreamer, self).remove_listener(event, listener)
+
+    def remove_event(self, event):
+        self._handlers.clear()
+        super(JSONStreamer, self).remove_event(event)
+
+    def add_catch_all_listener(self, listener):
+        self._handlers.clear()
+        super(JSONStreamer, self).add_catch_all_listener(listener)
+
+    def remove_catch_all_listener(self, listener):
+        self._handlers.clear()
+        super(JSONStreamer, self).remove_catch_all_listener(listener)
+
+    def auto_listen(self, observer, prefix="_on_"):
+        self._handlers.clear()
+        super(JSONStreamer, self).auto_listen(observer, prefix)
 
     def on_start_map(self, ctx):
         self._stack.append(JSONCompositeType.OBJECT)
@@ -146,7 +208,7 @@ class JSONStreamer(events.EventSource, YajlListener):
 
     def on_number(self, ctx, value):
         ''' Since this is defined both integer and double callbacks are useless '''
-        value = int(value) if value.isdigit() else float(value)
+        value = int(value) if value.lstrip('-').isdigit() else float(value)
         top = self._stack[-1]
         if top is JSONCompositeType.OBJECT:
             self.fire(JSONStreamer.VALUE_EVENT, value)
@@ -176,22 +238,28 @@ class JSONStreamer(events.EventSource, YajlListener):
             Attach all your listeners before calling this method
 
         Args:
-            data (str): input json string
+            data (str|bytes): input json string, or the same as UTF-8 encoded bytes
         """
         if not self._started:
             self.fire(JSONStreamer.DOC_START_EVENT)
             self._started = True
+        if isinstance(data, str):
+            data = data.encode('utf-8')
         self._file_like.write(data)
         try:
             self._parser.parse(self._file_like)
-        except YajlError as ye:
-            raise JSONStreamerException(ye.value)
+        except (YajlError, StdlibError) as e:
+            raise JSONStreamerException(e.value)
 
     def close(self):
-        """Closes the streamer which causes a `DOC_END_EVENT` to be fired  and frees up memory used by yajl"""
+        """Closes the streamer which causes a `DOC_END_EVENT` to be fired  and frees up memory used by the parser"""
+        # the parser goes first: the stdlib backend may still hold a trailing value
+        try:
+            self._parser.close()
+        except StdlibError as e:
+            raise JSONStreamerException(e.value)
         self.fire(JSONStreamer.DOC_END_EVENT)
         self._stack = None
-        self._parser.close()
 
 
 class ObjectStreamer(events.EventSource):
@@ -0,0 +1,185 @@
+"""
+Pure Python stand-in for the yajl backend, built on the json module
+"""
+
+from codecs import getincrementaldecoder
+from json import JSONDecoder, JSONDecodeError
+from json.decoder import scanstring
+from re import compile as re_compile
+
+
+class StdlibError(Exception):
+    def __init__(self, value=''):
+        self.value = value
+
+    def __str__(self):
+        return self.value
+
+
+WHITESPACE = re_compile(r'[ \t\n\r]*')
+# characters that would carry on a number cut short at the end of a chunk,
+# as in '2.' or '1e-'
+NUMBER_TAIL = frozenset('0123456789.eE+-')
+
+# what the parser expects next at the top level
+VALUE = 1           # a top level value, or a value inside the top level container
+KEY = 2             # an object key
+KEY_OR_END = 3      # an object key or "}", right after "{"
+VALUE_OR_END = 4    # an array element or "]", right after "["
+COLON = 5
+COMMA_OR_END = 6
+
+
+class StdlibParser:
+    '''
+    Drop-in replacement for :class:`jsonstreamer.yajl.parse.YajlParser`.
+
+    Only the outermost container is actually parsed incrementally: each of
+    its members is cut out whole and handed to json.JSONDecoder.raw_decode,
+    then replayed to the listener as the same callbacks yajl would make.
+    This plays to the strength of the json module's C scanner when, as with
+    the Roll20 msgdata, the top level is a long run of small objects.
+    '''
+
+    def __init__(self, listener):
+        '''
+        :type listener: :class:`jsonstreamer.yajl.parse.YajlListener`
+        :param listener: instance hosting the callbacks that will be called while parsing.
+        '''
+        self._listener = listener
+        self._raw_decode = JSONDecoder().raw_decode
+        self._utf8 = getincrementaldecoder('utf-8')()
+        self._text = ''
+        self._pos = 0
+        self._containers = []
+        self._state = VALUE
+        self._on_number = hasattr(listener, 'on_number')
+
+    def _emit(self, value):
+        listener = self._listener
+        if isinstance(value, str):
+            listener.on_string(None, value)
+        elif isinstance(value, dict):
+            listener.on_start_map(None)
+            for k, v in value.items():
+                listener.on_map_key(None, k)
+                self._emit(v)
+            listener.on_end_map(None)
+        elif isinstance(value, list):
+            listener.on_start_array(None)
+            for v in value:
+                self._emit(v)
+            listener.on_end_array(None)
+        elif value is None:
+            listener.on_null(None)
+        elif value is True or value is False:
+            listener.on_boolean(None, value)
+        elif self._on_number:
+            # yajl hands over the number as text: mirror it
+            listener.on_number(None, str(value))
+        elif isinstance(value, int):
+            listener.on_integer(None, value)
+        else:
+            listener.on_double(None, value)
+
+    def _close_container(self):
+        if self._containers.pop() == '{':
+            self._listener.on_end_map(None)
+        else:
+            self._listener.on_end_array(None)
+
+    def _step(self, final):
+        '''
+        consume as much of the buffered text as possible
+        :return: True if input ran out on an incomplete token
+        '''
+        text = self._text
+        state = self._state
+        containers = self._containers
+        pos = self._pos
+        end = len(text)
+
+        while True:
+            pos = WHITESPACE.match(text, pos).end()
+            if pos == end:
+                break
+            char = text[pos]
+
+            if state == COLON:
+                if char != ':':
+                    raise StdlibError('expected ":" at offset {}'.format(pos))
+                pos += 1
+                state = VALUE
+            elif state == COMMA_OR_END:
+                if char == ',':
+                    pos += 1
+                    state = KEY if containers[-1] == '{' else VALUE
+                elif char == '}' and containers[-1] == '{' or char == ']' and containers[-1] == '[':
+                    pos += 1
+                    self._close_container()
+                    state = VALUE
+                else:
+                    raise StdlibError('expected "," or closing bracket at offset {}'.format(pos))
+            elif (state == KEY_OR_END and char == '}') or (state == VALUE_OR_END and char == ']'):
+                pos += 1
+                self._close_container()
+                state = VALUE
+            elif state == KEY or state == KEY_OR_END:
+                if char != '"':
+                    raise StdlibError('expected object key at offset {}'.format(pos))
+                try:
+                    key, pos = scanstring(text, pos + 1)
+                except JSONDecodeError:
+                    break
+                self._listener.on_map_key(None, key)
+                state = COLON
+            elif not containers and (char == '{' or char == '['):
+                # the top level container: the only one parsed piecemeal
+                pos += 1
+                containers.append(char)
+                if char == '{':
+                    self._listener.on_start_map(None)
+                    state = KEY_OR_END
+                else:
+                    self._listener.on_start_array(None)
+                    state = VALUE_OR_END
+            else:
+                try:
+                    value, value_end = self._raw_decode(text, pos)
+                except JSONDecodeError:
+                    break
+                if not final and (value_end == end or text[value_end] in NUMBER_TAIL
+                                  and type(value) in (int, float)):
+                    # a number might carry on in the next chunk: raw_decode
+                    # takes '2.' for 2 and stops at the '.'
+                    break
+                pos = value_end
+                self._emit(value)
+                state = COMMA_OR_END if containers else VALUE
+
+        self._pos = pos
+        self._state = state
+        return pos != end
+
+    def parse(self, f):
+        '''parse a JSON stream.
+        :type f: :class:`jsonstreamer.tape.Tape`
+        :param f: stream to parse JSON from
+        :raises StdlibError: When invalid JSON in input stream found
+        '''
+        self._listener.parse_start()
+
+        while len(f):
+            data = self._utf8.decode(f.read())
+            # only the incomplete tail of the previous read is carried over
+            self._text = self._text[self._pos:] + data
+            self._pos = 0
+            self._step(False)
+            self._listener.parse_buf()
+
+    def close(self):
+        self._text = self._text[self._pos:] + self._utf8.decode(b'', True)
+        self._pos = 0
+        if self._step(True) or self._containers:
+            raise StdlibError('incomplete JSON at end of input: {}'.format(self._text[self._pos:][:40]))
+        self._listener.complete_parse()
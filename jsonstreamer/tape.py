@@ -1,40 +1,61 @@
+from collections import deque
+
+
 class Tape:
     """
     Allows writing to end of a file-like object while maintaining the read pointer accurately.
-    The read operation actually removes characters read from the buffer.
+    The read operation actually removes bytes read from the buffer.
+
+    Written chunks are queued as they are and handed back out as memoryview slices, so neither
+    reading nor writing ever copies or shifts the data still on the tape.
     """
 
-    def __init__(self, initial_value:str=''):
+    def __init__(self, initial_value:bytes=b''):
         """
-        :param initial_value: initialize the Tape with a preset string
+        :param initial_value: initialize the Tape with preset bytes
         """
-        self._buffer = initial_value
+        self._chunks = deque()
+        self._offset = 0
+        self._len = 0
+        if initial_value:
+            self.write(initial_value)
 
     def read(self, size:int=None):
         """
-        :param size: number of characters to read from the buffer
-        :return: string that has been read from the buffer
+        :param size: maximum number of bytes to read from the buffer
+        :return: memoryview of the bytes that have been read. A read never spans two written chunks,
+            so it may return fewer than size bytes even if more are available
         """
+        if not self._chunks:
+            return memoryview(b'')
+        chunk = self._chunks[0]
         if size:
-            result = self._buffer[0:size]
-            self._buffer = self._buffer[size:]
-            return result
+            end = min(len(chunk), self._offset + size)
         else:
-            result = self._buffer
-            self._buffer = ''
-            return result
+            end = len(chunk)
+        result = memoryview(chunk)[self._offset:end]
+        if end == len(chunk):
+            self._chunks.popleft()
+            self._offset = 0
+        else:
+            self._offset = end
+        self._len -= len(result)
+        return result
 
-    def write(self, s:str):
+    def write(self, s:bytes):
         """
-        :param s: some characters to write to the end of the tape
-        :return: length of characters written
+        :param s: some bytes to write to the end of the tape
+        :return: length of bytes written
         """
-        self._buffer += s
+        if not isinstance(s, bytes):
+            s = bytes(s)
+        if s:
+            self._chunks.append(s)
+            self._len += len(s)
         return len(s)
 
     def __len__(self):
-        return len(self._buffer)
-
-    def __str__(self):
-        return self._buffer
+        return self._len
 
+    def __bytes__(self):
+        return b''.join(self._chunks)[self._offset:]
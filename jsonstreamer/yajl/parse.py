@@ -28,23 +28,55 @@ def load_lib():
     raise OSError('Yajl cannot be found.')
 
 
-yajl = load_lib()
-
-yajl.yajl_alloc.restype = c_void_p
-yajl.yajl_alloc.argtypes = [c_void_p, c_void_p, c_void_p]
-yajl.yajl_config.restype = c_int
-yajl.yajl_config.argtypes = [c_void_p, c_int]
-yajl.yajl_free.argtypes = [c_void_p]
-yajl.yajl_parse.restype = c_int
-yajl.yajl_parse.argtypes = [c_void_p, c_char_p, c_size_t]
-yajl.yajl_complete_parse.restype = c_int
-yajl.yajl_complete_parse.argtypes = [c_void_p]
-yajl.yajl_get_error.restype = c_char_p
-yajl.yajl_get_error.argtypes = [c_void_p, c_int, c_char_p, c_size_t]
-yajl.yajl_get_bytes_consumed.restype = c_size_t
-yajl.yajl_get_bytes_consumed.argtypes = [c_void_p]
-yajl.yajl_free_error.restype = None
-yajl.yajl_free_error.argtypes = [c_void_p, c_char_p]
+try:
+    yajl = load_lib()
+except OSError:
+    # callers are expected to check and fall back to another backend
+    yajl = None
+
+if yajl is not None:
+    yajl.yajl_alloc.restype = c_void_p
+    yajl.yajl_alloc.argtypes = [c_void_p, c_void_p, c_void_p]
+    yajl.yajl_config.restype = c_int
+    yajl.yajl_config.argtypes = [c_void_p, c_int]
+    yajl.yajl_free.argtypes = [c_void_p]
+    yajl.yajl_parse.restype = c_int
+    yajl.yajl_parse.argtypes = [c_void_p, c_void_p, c_size_t]
+    yajl.yajl_complete_parse.restype = c_int
+    yajl.yajl_complete_parse.argtypes = [c_void_p]
+    yajl.yajl_get_error.restype = c_char_p
+    yajl.yajl_get_error.argtypes = [c_void_p, c_int, c_void_p, c_size_t]
+    yajl.yajl_get_bytes_consumed.restype = c_size_t
+    yajl.yajl_get_bytes_consumed.argtypes = [c_void_p]
+    yajl.yajl_free_error.restype = None
+    yajl.yajl_free_error.argtypes = [c_void_p, c_char_p]
+
+
+# Buffer protocol access, so yajl can read straight out of memoryviews
+class Py_buffer(Structure):
+    _fields_ = [
+        ("buf", c_void_p),
+        ("obj", c_void_p),
+        ("len", c_ssize_t),
+        ("itemsize", c_ssize_t),
+        ("readonly", c_int),
+        ("ndim", c_int),
+        ("format", c_char_p),
+        ("shape", c_void_p),
+        ("strides", c_void_p),
+        ("suboffsets", c_void_p),
+        ("internal", c_void_p),
+    ]
+
+
+PyBUF_SIMPLE = 0
+
+PyObject_GetBuffer = pythonapi.PyObject_GetBuffer
+PyObject_GetBuffer.restype = c_int
+PyObject_GetBuffer.argtypes = [py_object, POINTER(Py_buffer), c_int]
+PyBuffer_Release = pythonapi.PyBuffer_Release
+PyBuffer_Release.restype = None
+PyBuffer_Release.argtypes = [POINTER(Py_buffer)]
 
 # Callback Functions
 YAJL_NULL = CFUNCTYPE(c_int, c_void_p)
@@ -143,66 +175,67 @@ class YajlParser:
         names are similar to that of yajl names less the "yajl_" prefix,
         for example: to enable yajl_allow_comments, set self.allow_comments=True
         '''
+        if yajl is None:
+            raise OSError('Yajl cannot be found.')
+
         c_funcs = (
             YAJL_NULL, YAJL_BOOL, YAJL_INT, YAJL_DBL, YAJL_NUM,
             YAJL_STR, YAJL_SDCT, YAJL_DCTK, YAJL_EDCT, YAJL_SARR,
             YAJL_EARR
         )
 
-        def on_null(ctx):
-            return dispatch('on_null', ctx)
-
-        def on_boolean(ctx, boolVal):
-            return dispatch('on_boolean', ctx, boolVal)
-
-        def on_integer(ctx, integerVal):
-            return dispatch('on_integer', ctx, integerVal)
-
-        def on_double(ctx, doubleVal):
-            return dispatch('on_double', ctx, doubleVal)
-
-        def on_number(ctx, stringVal, stringLen):
-            return dispatch('on_number', ctx, string_at(stringVal, stringLen).decode('utf-8'))
-
-        def on_string(ctx, stringVal, stringLen):
-            return dispatch('on_string', ctx, string_at(stringVal, stringLen).decode('utf-8'))
-
-        def on_start_map(ctx):
-            return dispatch('on_start_map', ctx)
-
-        def on_map_key(ctx, stringVal, stringLen):
-            return dispatch('on_map_key', ctx, string_at(stringVal, stringLen).decode('utf-8'))
-
-        def on_end_map(ctx):
-            return dispatch('on_end_map', ctx)
-
-        def on_start_array(ctx):
-            return dispatch('on_start_array', ctx)
-
-        def on_end_array(ctx):
-            return dispatch('on_end_array', ctx)
-
-        def dispatch(func, *args, **kwargs):
-            try:
-                getattr(self._listener, func)(*args, **kwargs)
+        # each callback is bound once, here, to the listener's method: yajl
+        # calls them for every single token, so they must do as little as
+        # possible. try costs nothing unless something is actually raised
+        def bind_plain(method):
+            def callback(ctx):
+                try:
+                    method(ctx)
+                except Exception:
+                    self._exc_info = sys.exc_info()
+                    return 0
+                return 1
+            return callback
+
+        def bind_value(method):
+            def callback(ctx, value):
+                try:
+                    method(ctx, value)
+                except Exception:
+                    self._exc_info = sys.exc_info()
+                    return 0
                 return 1
-            except Exception as e:
-                self._exc_info = sys.exc_info()
-                return 0
+            return callback
+
+        def bind_string(method):
+            def callback(ctx, stringVal, stringLen):
+                try:
+                    method(ctx, string_at(stringVal, stringLen).decode('utf-8'))
+                except Exception:
+                    self._exc_info = sys.exc_info()
+                    return 0
+                return 1
+            return callback
 
         if listener is None:
             self.callbacks = None
         else:
+            # cannot have both number and integer|double
+            # if yajl_number is available, it takes precedence
+            has_number = hasattr(listener, 'on_number')
             callbacks = [
-                on_null, on_boolean, on_integer, on_double, on_number, on_string, on_start_map, on_map_key,
-                on_end_map, on_start_array, on_end_array,
+                bind_plain(listener.on_null),
+                bind_value(listener.on_boolean),
+                0 if has_number else bind_value(listener.on_integer),
+                0 if has_number else bind_value(listener.on_double),
+                bind_string(listener.on_number) if has_number else 0,
+                bind_string(listener.on_string),
+                bind_plain(listener.on_start_map),
+                bind_string(listener.on_map_key),
+                bind_plain(listener.on_end_map),
+                bind_plain(listener.on_start_array),
+                bind_plain(listener.on_end_array),
             ]
-            # cannot have both number and integer|double
-            if hasattr(listener, 'on_number'):
-                # if yajl_number is available, it takes precedence
-                callbacks[2] = callbacks[3] = 0
-            else:
-                callbacks[4] = 0
             # cast the funcs to C-types
             callbacks = [
                 c_func(callback)
@@ -213,6 +246,7 @@ class YajlParser:
         # set self's vars
         self._buffer_size = 65536
         self._listener = listener
+        self._exc_info = None
         self._handler = yajl.yajl_alloc(self.callbacks, None, None)
         self._config(self._handler)
         self.allow_partial_values = True
@@ -228,16 +262,26 @@ class YajlParser:
 
     def parse(self, f):
         '''parse a JSON stream.
-        :type f: file
+        :type f: :class:`jsonstreamer.tape.Tape`
         :param f: stream to parse JSON from
         :type context: ctypes.POINTER
         :raises YajlError: When invalid JSON in input stream found
         '''
         self._listener.parse_start()
 
+        view = Py_buffer()
         while len(f):
-            data = f.read(self._buffer_size).encode('utf-8')
-            status = yajl.yajl_parse(self._handler, data, len(data))
+            data = f.read(self._buffer_size)
+            # borrow the pointer to the bytes backing the memoryview rather
+            # than copying them into a fresh bytes object for c_char_p
+            PyObject_GetBuffer(data, byref(view), PyBUF_SIMPLE)
+            try:
+                status = yajl.yajl_parse(self._handler, view.buf, view.len)
+                if status != OK.value and status != CLIENT_CANCELLED.value:
+                    yajl.yajl_get_error.restype = c_char_p
+                    error = yajl.yajl_get_error(self._handler, 1, view.buf, view.len)
+            finally:
+                PyBuffer_Release(byref(view))
             self._listener.parse_buf()
             if status != OK.value:
                 if status == CLIENT_CANCELLED.value:
@@ -247,8 +291,6 @@ class YajlParser:
                     else:
                         raise YajlError("Client probably cancelled callback")
                 else:
-                    yajl.yajl_get_error.restype = c_char_p
-                    error = yajl.yajl_get_error(self._handler, 1, data, len(data))
                     raise YajlError(error)
             if not data: return
 
@@ -1,11 +1,17 @@
-from base64 import b64decode
-from enum import Enum
+from binascii import a2b_base64
+from codecs import getincrementaldecoder
+from enum import Enum, IntEnum
+from io import StringIO
 from jsonstreamer import JSONStreamer
 from json import loads
-from sys import exit, stderr
-from traceback import print_exc
+from re import compile as re_compile
+from sys import intern
 
-SaxState = Enum(
+import profiler
+
+# an IntEnum hashes as fast as an int, for the transition tables of
+# JsonSaxParser
+SaxState = IntEnum(
     'SaxState',
     'START                      \
     BETWEEN_POSTS               \
@@ -26,7 +32,7 @@ SaxState = Enum(
 
 
 class ParseError(Exception):
-    def __init__(message):
+    def __init__(self, message):
         self.message = message
 
 
@@ -48,6 +54,7 @@ class PostType:
             'rollresult': ROLLRESULT,
             'gmrollresult': GMROLLRESULT,
             }
+    _namedict = {value: key for key, value in _stringdict.items()}
 
 
     @staticmethod
@@ -55,19 +62,246 @@ class PostType:
         return PostType._stringdict[string]
 
 
+    @staticmethod
+    def to_string(type):
+        return PostType._namedict.get(type)
+
+
+# post type -> function(who, content, total, target_name) giving its line of
+# text. types that aren't in here never show up in the chatlog
+_formatters = {}
+
+
+def _formats(type):
+    def register(formatter):
+        _formatters[type] = formatter
+        return formatter
+    return register
+
+
+@_formats(PostType.GENERAL)
+def _format_general(who, content, total, target_name):
+    return ''.join([who, ': ', content, '\n'])
+
+
+@_formats(PostType.EMOTE)
+def _format_emote(who, content, total, target_name):
+    return ''.join([who, ' ', content, '\n'])
+
+
+@_formats(PostType.DESC)
+def _format_desc(who, content, total, target_name):
+    return ''.join([content, '\n'])
+
+
+@_formats(PostType.ROLLRESULT)
+def _format_rollresult(who, content, total, target_name):
+    return ''.join([who, ': ', content, ' = ', str(total), '\n'])
+
+
+@_formats(PostType.GMROLLRESULT)
+def _format_gmrollresult(who, content, total, target_name):
+    return ''.join([who, ' (to GM): ', content, ' = ', str(total), '\n'])
+
+
+@_formats(PostType.WHISPER)
+def _format_whisper(who, content, total, target_name):
+    return ''.join([who, ' (whispering to ', target_name, '): ', content, '\n'])
+
+
+def format_post(type, who, content, total, target_name):
+    """
+    The line of text for a post, or None for the types that never show up.
+    For rolls, content is the roll expression and total its result.
+    """
+    formatter = _formatters.get(type)
+    if formatter is None:
+        return None
+    return formatter(who, content, total, target_name)
+
+
+# no leading zeros, just like the '$[[%d]]' the placeholders are made of
+INLINE_ROLL = re_compile(r'\$\[\[(0|[1-9][0-9]*)\]\]')
+
+
+def substitute_inlinerolls(content, inlinerolls):
+    """Puts the results of the inline rolls in place of their $[[n]] in one pass."""
+    if not inlinerolls or '$[[' not in content:
+        return content
+    if len(inlinerolls) == 1:
+        return content.replace('$[[0]]', inlinerolls[0])
+    # every other part is the number of a roll
+    parts = INLINE_ROLL.split(content)
+    for j in range(1, len(parts), 2):
+        i = int(parts[j])
+        parts[j] = inlinerolls[i] if i < len(inlinerolls) else '$[[' + parts[j] + ']]'
+    return ''.join(parts)
+
+
+class PostRenderer:
+    """
+    Turns the fields of a single post into its line of text, or None if the
+    post must not show up in the chatlog. Every parsing strategy goes through
+    here so that they all produce the same output.
+
+    Post IDs sort chronologically, so the renderer also keeps track of the
+    newest one it has seen and drops every post no newer than since.
+
+    With keep_rows, every post that shows up is also kept in rows as a tuple
+    of ID, type, who, playerid, target, content and roll total, for the
+    database (see database.PostDatabase).
+    """
+
+    def __init__(self, playerid, is_gm, since=None, keep_rows=False):
+        self._playerid = playerid
+        self._is_gm = is_gm
+        self._since = since
+        self.newest_id = None
+        self.reached_since = False
+        self.new_posts = 0
+        self.rows = [] if keep_rows else None
+
+
+    def render(self, post_id, type, who, content, origRoll, post_playerid, target_playerid, target_name, inlinerolls):
+        if post_id is not None:
+            if self.newest_id is None or post_id > self.newest_id:
+                self.newest_id = post_id
+            if self._since is not None and post_id <= self._since:
+                self.reached_since = True
+                return None
+
+        formatter = _formatters.get(type)
+        if formatter is None:
+            return None
+        if inlinerolls:
+            content = substitute_inlinerolls(content, inlinerolls)
+        total = None
+        prepare = _preparers.get(type)
+        if prepare is not None:
+            prepared = prepare(self, content, origRoll, post_playerid, target_playerid)
+            if prepared is None:
+                return None
+            content, total = prepared
+        line = formatter(who, content, total, target_name)
+        # only what makes it into the chatlog counts as new
+        self.new_posts += 1
+
+        if self.rows is not None:
+            self.rows.append((
+                post_id,
+                PostType.to_string(type),
+                who,
+                post_playerid,
+                target_name,
+                content,
+                total
+                ))
+        return line
+
+
+    def _prepare_roll(self, content, origRoll, post_playerid, target_playerid):
+        # "content" in this case is a JSON... saved as an escaped
+        # string. because hail satan, i suppose
+        return origRoll, loads(content)['total']
+
+
+    def _prepare_gmroll(self, content, origRoll, post_playerid, target_playerid):
+        # same deal...
+        # privacy of GM rolls must be enforced client-side
+        if post_playerid == self._playerid or self._is_gm:
+            return self._prepare_roll(content, origRoll, post_playerid, target_playerid)
+        return None
+
+
+    def _prepare_whisper(self, content, origRoll, post_playerid, target_playerid):
+        # privacy of whispers must be enforced client-side
+        # note: the target can be a comma-separated list
+        # why not a JSON array? belzeebub's will again for sure
+        if post_playerid == self._playerid or self._playerid in target_playerid:
+            return content, None
+        return None
+
+
+# post types needing more than formatting -> function taking the renderer and
+# the post, returning its content and roll total, or None to hide it
+_preparers = {
+        PostType.ROLLRESULT: PostRenderer._prepare_roll,
+        PostType.GMROLLRESULT: PostRenderer._prepare_gmroll,
+        PostType.WHISPER: PostRenderer._prepare_whisper,
+        }
+
+
+class Post:
+    """
+    One post of a chatlog, as handed out by roll20.iter_chatlog: the same
+    fields as the rows of PostRenderer, in the same order, so it unpacks like
+    one. type is the string Roll20 uses for it.
+
+    Chatlogs are hundreds of thousands of posts by a handful of people, so
+    speakers and player IDs are interned: each is kept only once.
+    """
+
+    __slots__ = ('id', 'type', 'who', 'playerid', 'target_name', 'content', 'total')
+
+    def __init__(self, id, type, who, playerid, target_name, content, total):
+        self.id = id
+        self.type = type
+        self.who = intern(who) if who is not None else None
+        self.playerid = intern(playerid) if playerid is not None else None
+        self.target_name = target_name
+        self.content = content
+        self.total = total
+
+
+    def __iter__(self):
+        return iter((self.id, self.type, self.who, self.playerid, self.target_name, self.content, self.total))
+
+
+    def __repr__(self):
+        return 'Post({})'.format(', '.join(repr(field) for field in self))
+
+
+    def line(self):
+        """The post as a line of the chatlog text file."""
+        return format_post(PostType.from_string(self.type), self.who, self.content, self.total, self.target_name)
+
+
 class JsonSaxParser:
     # TODO: better roll parsing to show details of single dice
     # TODO: inlinerolls (e.g. macros and calculator-like expressions)
 
-    def __init__(self, filepath, playerid, is_gm):
-        self._filepath = filepath 
-        self._playerid = playerid
-        self._is_gm = is_gm
+    # this gets called for every single token of the payload: keys and values
+    # go through the transition tables below the class, and attributes live
+    # in slots
+    __slots__ = (
+            '_output',
+            '_renderer',
+            '_streamer',
+            '_state',
+            '_skipping_brackets',
+            '_post_id',
+            '_type',
+            '_post_playerid',
+            '_target_playerid',
+            '_who',
+            '_content',
+            '_origRoll',
+            '_target_name',
+            '_inlinerolls',
+            '_inlineroll_expression',
+            )
+
+    def __init__(self, output, renderer):
+        self._output = output
+        self._renderer = renderer
         self._streamer = JSONStreamer()
         self._streamer.auto_listen(self)
         self._state = SaxState.START
         self._skipping_brackets = 0
+        self._post_id = None
+        self._type = None
         self._post_playerid = None
+        self._target_playerid = None
         self._who = None
         self._content = None
         self._origRoll = None
@@ -76,168 +310,250 @@ class JsonSaxParser:
         self._inlineroll_expression = None
 
 
-    def _on_doc_start(self):
-        self._file = open(self._filepath, 'w')
-
-
-    def _on_doc_end(self):
-        try:
-            self._file.close()
-        except AttributeError:
-            pass
-
-
     def _on_object_start(self):
         if self._state == SaxState.START:
             self._state = SaxState.BETWEEN_POSTS
         elif self._state == SaxState.IN_POST:
             self._state = SaxState.POST_CONTENTS
-        elif self._state == SaxState.IN_INLINEROLLS or self._state == SaxState.IN_SELECTED:
+        elif self._state in _SKIPPED:
             self._skipping_brackets += 1
 
 
     def _on_object_end(self):
         if self._state == SaxState.POST_CONTENTS:
-            for i, roll in enumerate(self._inlinerolls):
-                self._content = self._content.replace( '$[[%d]]' % i, roll)
-
-            if self._type == PostType.GENERAL:
-                post = ''.join([self._who, ': ', self._content, '\n'])
-            elif self._type == PostType.EMOTE:
-                post = ''.join([self._who, ' ', self._content, '\n'])
-            elif self._type == PostType.DESC:
-                post = ''.join([self._content, '\n'])
-            elif self._type == PostType.ROLLRESULT:
-                # "content" in this case is a JSON... saved as an escaped
-                # string. because hail satan, i suppose
-                roll = loads(self._content)
-                post = ''.join(
-                        [
-                            self._who,
-                            ': ',
-                            self._origRoll,
-                            ' = ',
-                            str(roll['total']),
-                            '\n'
-                        ]
-                    )
-            elif self._type == PostType.GMROLLRESULT:
-                # same deal...
-                # privacy of GM rolls must be enforced client-side
-                if self._post_playerid == self._playerid or self._is_gm:
-                    roll = loads(self._content)
-                    post = ''.join(
-                            [
-                                self._who,
-                                ' (to GM): ',
-                                self._origRoll,
-                                ' = ',
-                                str(roll['total']),
-                                '\n'
-                            ]
-                        )
-                else:
-                    self._type = PostType.IGNORE
-            elif self._type == PostType.WHISPER:
-                # privacy of whispers must be enforced client-side
-                # note: the target can be a comma-separated list
-                # why not a JSON array? belzeebub's will again for sure
-                if self._post_playerid == self._playerid \
-                        or self._playerid in self._target_playerid:
-                    post = ''.join(
-                            [
-                                self._who,
-                                ' (whispering to ',
-                                self._target_name,
-                                '): ',
-                                self._content,
-                                '\n'
-                            ]
-                        )
-                else:
-                    self._type = PostType.IGNORE
-
-
-            if self._type != PostType.IGNORE:
-                self._file.write(post)
+            if profiler.enabled:
+                start = profiler.enter()
+                post = None
+                try:
+                    post = self._render()
+                finally:
+                    profiler.leave('render', start, len(post) if post is not None else 0, 1)
+            else:
+                post = self._render()
+            if post is not None:
+                self._output.write(post)
 
+            self._post_id, self._type = (None, None)
             self._who, self._content, self._origRoll = (None, None, None)
-            self._post_playerd, self._target_playerid = (None, None)
+            self._post_playerid, self._target_playerid, self._target_name = (None, None, None)
             self._inlinerolls = []
             self._state = SaxState.BETWEEN_POSTS
-        elif self._state == SaxState.IN_INLINEROLLS or self._state == SaxState.IN_SELECTED:
+        elif self._state in _SKIPPED:
+            self._skipping_brackets -= 1
+            if self._skipping_brackets == 0:
+                self._state = SaxState.POST_CONTENTS
+
+
+    # arrays only matter for keeping count of brackets while skipping: both
+    # inlinerolls and selected are lists, possibly of more than one object
+    def _on_array_start(self):
+        if self._state in _SKIPPED:
+            self._skipping_brackets += 1
+
+
+    def _on_array_end(self):
+        if self._state in _SKIPPED:
             self._skipping_brackets -= 1
             if self._skipping_brackets == 0:
                 self._state = SaxState.POST_CONTENTS
 
 
     def _on_key(self, key):
-        if self._state == SaxState.BETWEEN_POSTS:
+        transitions = _KEY_TRANSITIONS.get(self._state)
+        if transitions is not None:
+            # keys that aren't in the table leave the state alone
+            self._state = transitions.get(key, self._state)
+        elif self._state == SaxState.BETWEEN_POSTS:
+            self._post_id = key
             self._state = SaxState.IN_POST
-        elif self._state == SaxState.POST_CONTENTS:
-            if key == 'playerid':
-                self._state = SaxState.IN_PLAYERID
-            elif key == 'who':
-                self._state = SaxState.IN_WHO
-            elif key == 'content':
-                self._state = SaxState.IN_CONTENT
-            elif key == 'type':
-                self._state = SaxState.IN_TYPE
-            elif key == 'origRoll':
-                self._state = SaxState.IN_ORIGROLL
-            elif key == 'inlinerolls':
-                self._state = SaxState.IN_INLINEROLLS
-            elif key == 'target':
-                self._state = SaxState.IN_TARGET_PLAYERID
-            elif key == 'target_name':
-                self._state = SaxState.IN_TARGET_NAME
-            elif key == 'selected':
-                self._state = SaxState.IN_SELECTED
-        elif self._state == SaxState.IN_INLINEROLLS:
-            if key == 'expression':
-                self._state = SaxState.IN_INLINEROLLS_EXPRESSION
-            elif key == 'total':
-                self._state = SaxState.IN_INLINEROLLS_TOTAL
 
 
     def _on_value(self, value):
-        if self._state == SaxState.IN_PLAYERID:
-            self._post_playerid = value
-            self._state = SaxState.POST_CONTENTS
-        elif self._state == SaxState.IN_WHO:
-            self._who = value
-            self._state = SaxState.POST_CONTENTS
-        elif self._state == SaxState.IN_CONTENT:
-            self._content = value
-            self._state = SaxState.POST_CONTENTS
-        elif self._state == SaxState.IN_ORIGROLL:
-            self._origRoll = value
-            self._state = SaxState.POST_CONTENTS
-        elif self._state == SaxState.IN_TYPE:
-            self._type = PostType.from_string(value)
-            self._state = SaxState.POST_CONTENTS
-        elif self._state == SaxState.IN_TARGET_PLAYERID:
-            self._target_playerid = value
-            self._state = SaxState.POST_CONTENTS
-        elif self._state == SaxState.IN_TARGET_NAME:
-            self._target_name = value
-            self._state = SaxState.POST_CONTENTS
-        elif self._state == SaxState.IN_INLINEROLLS_EXPRESSION:
-            self._inlineroll_expression = value
-            self._state = SaxState.IN_INLINEROLLS
-        elif self._state == SaxState.IN_INLINEROLLS_TOTAL:
-            self._inlinerolls.append(
-                    ''.join([self._inlineroll_expression, ' = ', str(value)])
-                    )
-            self._inlineroll_expression = None
-            self._state = SaxState.IN_INLINEROLLS
+        transition = _VALUE_TRANSITIONS.get(self._state)
+        if transition is not None:
+            store, self._state = transition
+            store(self, value)
+
+
+    # what _on_value does with the value, by state
+
+    def _store_playerid(self, value):
+        self._post_playerid = value
+
+
+    def _store_who(self, value):
+        self._who = value
+
+
+    def _store_content(self, value):
+        self._content = value
+
+
+    def _store_origRoll(self, value):
+        self._origRoll = value
+
+
+    def _store_type(self, value):
+        self._type = PostType.from_string(value)
+
+
+    def _store_target_playerid(self, value):
+        self._target_playerid = value
+
+
+    def _render(self):
+        return self._renderer.render(
+                self._post_id,
+                self._type,
+                self._who,
+                self._content,
+                self._origRoll,
+                self._post_playerid,
+                self._target_playerid,
+                self._target_name,
+                self._inlinerolls
+                )
+
+
+    def _store_target_name(self, value):
+        self._target_name = value
+
+
+    def _store_inlineroll_expression(self, value):
+        self._inlineroll_expression = value
+
+
+    def _store_inlineroll_total(self, value):
+        self._inlinerolls.append(
+                ''.join([self._inlineroll_expression, ' = ', str(value)])
+                )
+        self._inlineroll_expression = None
 
 
     def parse(self, chunk):
-        self._streamer.consume(chunk)
+        if not profiler.enabled:
+            self._streamer.consume(chunk)
+            return
+        start = profiler.enter()
+        try:
+            self._streamer.consume(chunk)
+        finally:
+            profiler.leave('json', start, len(chunk))
 
     def close(self):
-        self._streamer.close()
+        if not profiler.enabled:
+            self._streamer.close()
+            return
+        start = profiler.enter()
+        try:
+            self._streamer.close()
+        finally:
+            profiler.leave('json', start)
+
+
+# the states whose value is skipped whole, brackets and all
+_SKIPPED = frozenset([SaxState.IN_INLINEROLLS, SaxState.IN_SELECTED])
+
+# state -> key -> the state that key leads to
+_KEY_TRANSITIONS = {
+        SaxState.POST_CONTENTS: {
+            'playerid': SaxState.IN_PLAYERID,
+            'who': SaxState.IN_WHO,
+            'content': SaxState.IN_CONTENT,
+            'type': SaxState.IN_TYPE,
+            'origRoll': SaxState.IN_ORIGROLL,
+            'inlinerolls': SaxState.IN_INLINEROLLS,
+            'target': SaxState.IN_TARGET_PLAYERID,
+            'target_name': SaxState.IN_TARGET_NAME,
+            'selected': SaxState.IN_SELECTED,
+            },
+        SaxState.IN_INLINEROLLS: {
+            'expression': SaxState.IN_INLINEROLLS_EXPRESSION,
+            'total': SaxState.IN_INLINEROLLS_TOTAL,
+            },
+        }
+
+# state -> the JsonSaxParser method storing a value, and the state after it
+_VALUE_TRANSITIONS = {
+        SaxState.IN_PLAYERID: (JsonSaxParser._store_playerid, SaxState.POST_CONTENTS),
+        SaxState.IN_WHO: (JsonSaxParser._store_who, SaxState.POST_CONTENTS),
+        SaxState.IN_CONTENT: (JsonSaxParser._store_content, SaxState.POST_CONTENTS),
+        SaxState.IN_ORIGROLL: (JsonSaxParser._store_origRoll, SaxState.POST_CONTENTS),
+        SaxState.IN_TYPE: (JsonSaxParser._store_type, SaxState.POST_CONTENTS),
+        SaxState.IN_TARGET_PLAYERID: (JsonSaxParser._store_target_playerid, SaxState.POST_CONTENTS),
+        SaxState.IN_TARGET_NAME: (JsonSaxParser._store_target_name, SaxState.POST_CONTENTS),
+        SaxState.IN_INLINEROLLS_EXPRESSION: (JsonSaxParser._store_inlineroll_expression, SaxState.IN_INLINEROLLS),
+        SaxState.IN_INLINEROLLS_TOTAL: (JsonSaxParser._store_inlineroll_total, SaxState.IN_INLINEROLLS),
+        }
+
+
+class PayloadDecoder:
+    """
+    Incrementally decodes a base64 payload and pushes the result into sink.
+
+    Input is decoded in 4-byte-aligned runs straight off the chunk it arrived
+    in: only the (at most 3) bytes left over at the end of a chunk are carried
+    over to the next one. With text=True the decoded bytes then go through an
+    incremental UTF-8 decoder, so characters split across chunks need no
+    special handling; otherwise they are passed through as they are.
+    """
+
+    def __init__(self, sink, text=True):
+        self._sink = sink
+        self._carry = bytearray()
+        self._utf8 = getincrementaldecoder('utf-8')() if text else None
+
+
+    def _emit(self, data, final=False):
+        if self._utf8:
+            data = self._utf8.decode(data, final)
+        if data:
+            self._sink(data)
+
+
+    def feed(self, data):
+        if not profiler.enabled:
+            self._feed(data)
+            return
+        start = profiler.enter()
+        try:
+            self._feed(data)
+        finally:
+            profiler.leave('base64', start, len(data))
+
+
+    def _feed(self, data):
+        data = memoryview(data)
+        if self._carry:
+            missing = 4 - len(self._carry)
+            self._carry += data[:missing]
+            data = data[missing:]
+            if len(self._carry) < 4:
+                return
+            self._emit(a2b_base64(self._carry))
+            self._carry.clear()
+        stop = len(data) - (len(data) % 4)
+        if stop:
+            self._emit(a2b_base64(data[:stop]))
+        self._carry += data[stop:]
+
+
+    def close(self):
+        if not profiler.enabled:
+            self._close()
+            return
+        start = profiler.enter()
+        try:
+            self._close()
+        finally:
+            profiler.leave('base64', start)
+
+
+    def _close(self):
+        # a well-formed payload is padded to a multiple of 4, so whatever is
+        # left here can only fail with a proper binascii.Error
+        self._emit(a2b_base64(self._carry) if self._carry else b'', final=True)
+        self._carry.clear()
 
 
 ChatParserState = Enum(
@@ -248,82 +564,338 @@ ChatParserState = Enum(
 
 class ChatParser:
     
-    WHITESPACE = ' \n\r\t'
-
-    def __init__(self, filepath, playerid, is_gm):
-        self._filepath = filepath
+    WHITESPACE = b' \n\r\t'
+    MSGDATA = b'msgdata'
+
+    __slots__ = (
+            '_output',
+            '_raw',
+            'renderer',
+            '_parser_state',
+            '_scan_tail',
+            '_json_parser',
+            '_decoder',
+            )
+
+    def __init__(self, output, playerid, is_gm, since=None, raw=None, keep_rows=False):
+        self._output = output
+        # gets a copy of the decoded payload, if given (see cache.CacheWriter)
+        self._raw = raw
+        self.renderer = PostRenderer(playerid, is_gm, since, keep_rows)
         self._parser_state = ChatParserState.LOOKING
-        self._current_lexeme = []
-        self._input_tail = ''
-        self._json_parser = JsonSaxParser(filepath, playerid, is_gm)
-
-
-    def _get_lexemes(self, chunk):
-        for char in chunk:
-            if char in ChatParser.WHITESPACE:
-                if self._current_lexeme != []: yield ''.join(self._current_lexeme)
-                self._current_lexeme.clear()
-            elif char == '"': # '"' = 34
-                if self._current_lexeme != []: yield ''.join(self._current_lexeme)
-                yield '"'
-            else:
-                self._current_lexeme.append(char)
-        yield ''.join(self._current_lexeme)
-        self._current_lexeme.clear()
+        # the seed whitespace lets "msgdata" match at the very start of the page
+        self._scan_tail = b'\n'
+        self._json_parser = None
+
+
+    def _start_payload(self):
+        self._json_parser = JsonSaxParser(self._output, self.renderer)
+        # the JSON goes to yajl as raw bytes: only the string values it hands
+        # back are ever decoded
+        sink = self._json_parser.parse
+        if self._raw is not None:
+            def sink(data, parse=sink, write=self._raw.write):
+                write(data)
+                parse(data)
+        self._decoder = PayloadDecoder(sink, text=False)
+
+
+    def _find_msgdata(self, buf):
+        # returns the offset just past a whitespace-delimited "msgdata" in buf,
+        # -1 if there is none, or None if buf ends too early to tell.
+        # buf always starts with at least one byte of context from the
+        # previous chunk, so the search can begin at 1
+        start = 1
+        while True:
+            pos = buf.find(ChatParser.MSGDATA, start)
+            if pos == -1:
+                return -1
+            end = pos + len(ChatParser.MSGDATA)
+            if end == len(buf):
+                return None
+            if buf[pos - 1] in ChatParser.WHITESPACE \
+                    and (buf[end] in ChatParser.WHITESPACE or buf[end] == 61): # '=' = 61
+                return end
+            start = pos + 1
+
+
+    def _skip_whitespace(self, chunk, pos):
+        while pos < len(chunk) and chunk[pos] in ChatParser.WHITESPACE:
+            pos += 1
+        return pos
 
 
     def finalize(self):
-        self._json_parser.close()
+        if self._json_parser is not None:
+            self._json_parser.close()
         self._parser_state = ChatParserState.LOOKING
-        self._current_lexeme = ''
-        self._input_tail = ''
+        self._scan_tail = b'\n'
 
 
-    def _get_short_lexeme(self):
-        if (len(lexeme) > 40):
-            return '{}...'.format(lexeme[:40])
+    def _get_short_lexeme(self, chunk, pos):
+        lexeme = chunk[pos : pos + 40].decode(errors='backslashreplace')
+        if len(chunk) - pos > 40:
+            return '{}...'.format(lexeme)
         else:
             return lexeme
 
 
     def process(self, chunk):
+        if not profiler.enabled:
+            self._process(chunk)
+            return
+        start = profiler.enter()
+        try:
+            self._process(chunk)
+        finally:
+            profiler.leave('lex', start, len(chunk))
+
+
+    def _process(self, chunk):
         if self._parser_state == ChatParserState.DONE: return
 
-        for lexeme in self._get_lexemes(chunk):
-            if self._parser_state == ChatParserState.LOOKING:
-                if (lexeme == 'msgdata'):
-                    self._parser_state = ChatParserState.MSGDATA
-            elif self._parser_state == ChatParserState.MSGDATA:
-                if (lexeme == '='):
-                    self._parser_state = ChatParserState.EQ
-                else:
-                    raise ParseError('ChatParser expected "=" after "msgdata", found "{}"'.format(self._get_short_lexeme()))
-            elif self._parser_state == ChatParserState.EQ:
-                if lexeme == '"':
-                    self._parser_state = ChatParserState.PAYLOAD
-                else:
-                    raise ParseError('ChatParser expected "\"" after "=", found "{}"'.format(self._get_short_lexeme()))
-            elif self._parser_state == ChatParserState.PAYLOAD:
-                if (lexeme == '"'):
-                    if self._input_tail != '':
-                        self._json_parser.parse(b64decode(self._input_tail).decode())
-                    self._parser_state = ChatParserState.DONE
-                else:
-                    to_decode = self._input_tail + lexeme
-                    b64_stop_pos = len(to_decode) - (len(to_decode) % 4)
-                    while True:
-                        try:
-                            self._json_parser.parse(b64decode(to_decode[: b64_stop_pos]).decode())
-                        except Exception as e:
-                            if isinstance(e, UnicodeDecodeError) and e.reason == 'unexpected end of data':
-                                # utf-8 character spans two chunks
-                                b64_stop_pos = e.start - (e.start % 4)
-                            else:
-                                stderr.write("\nERROR while processing " + self._filepath +  ", chunk:\n")
-                                stderr.write(b64decode(to_decode[: b64_stop_pos]).decode(errors="backslashreplace"))
-                                stderr.write("\n")
-                                print_exc()
-                                exit(1)
-                        else:
-                            self._input_tail = to_decode[b64_stop_pos :]
-                            break
+        pos = 0
+        if self._parser_state == ChatParserState.LOOKING:
+            # bulk search for the marker, keeping a short tail around in case
+            # it straddles two chunks
+            chunk = self._scan_tail + chunk
+            end = self._find_msgdata(chunk)
+            if end is None or end == -1:
+                self._scan_tail = chunk[-(len(ChatParser.MSGDATA) + 1) :]
+                return
+            self._scan_tail = b''
+            self._parser_state = ChatParserState.MSGDATA
+            pos = end
+
+        if self._parser_state == ChatParserState.MSGDATA:
+            pos = self._skip_whitespace(chunk, pos)
+            if pos == len(chunk): return
+            if chunk[pos] != 61: # '=' = 61
+                raise ParseError('ChatParser expected "=" after "msgdata", found "{}"'.format(self._get_short_lexeme(chunk, pos)))
+            self._parser_state = ChatParserState.EQ
+            pos += 1
+
+        if self._parser_state == ChatParserState.EQ:
+            pos = self._skip_whitespace(chunk, pos)
+            if pos == len(chunk): return
+            if chunk[pos] != 34: # '"' = 34
+                raise ParseError('ChatParser expected "\"" after "=", found "{}"'.format(self._get_short_lexeme(chunk, pos)))
+            self._parser_state = ChatParserState.PAYLOAD
+            self._start_payload()
+            pos += 1
+
+        if self._parser_state == ChatParserState.PAYLOAD:
+            end = chunk.find(b'"', pos)
+            if end == -1:
+                self._process_payload(memoryview(chunk)[pos:])
+            else:
+                self._process_payload(memoryview(chunk)[pos:end], final=True)
+                self._parser_state = ChatParserState.DONE
+
+
+    def _process_payload(self, lexeme, final=False):
+        try:
+            self._decoder.feed(lexeme)
+            if final:
+                self._decoder.close()
+        except Exception as e:
+            raise ParseError('ChatParser failed on the chatlog payload at "{}": {!r}'.format(
+                bytes(lexeme[:40]).decode(errors='backslashreplace'), e)) from e
+
+
+class BufferedChatParser(ChatParser):
+    """
+    Whole-page counterpart to ChatParser, for pages that comfortably fit in
+    memory: the payload is only collected while the page streams in, then
+    decoded and handed to json.loads in one go on finalize(). Posts go through
+    the same PostRenderer as the SAX path, so the output is identical.
+    """
+
+    __slots__ = ('_payload',)
+
+
+    def _start_payload(self):
+        self._payload = []
+
+
+    def _process_payload(self, lexeme, final=False):
+        self._payload.append(lexeme)
+
+
+    def finalize(self):
+        if self._parser_state == ChatParserState.PAYLOAD \
+                or self._parser_state == ChatParserState.DONE:
+            try:
+                self._finalize_payload()
+            except Exception as e:
+                # the same failure as the streaming parser's
+                raise ParseError('BufferedChatParser failed on the chatlog payload: {!r}'.format(e)) from e
+        self._parser_state = ChatParserState.LOOKING
+        self._scan_tail = b'\n'
+
+
+    def _finalize_payload(self):
+        payload = b''.join(self._payload)
+        self._payload = None
+        if profiler.enabled:
+            start = profiler.enter()
+            try:
+                data = a2b_base64(payload)
+            finally:
+                profiler.leave('base64', start, len(payload))
+        else:
+            data = a2b_base64(payload)
+        payload = None
+        if self._raw is not None:
+            self._raw.write(data)
+        # like the SAX path, an empty payload renders nothing at all
+        if data:
+            _render_posts(_loads(data), self.renderer, self._output)
+
+
+def _loads(data):
+    if not profiler.enabled:
+        return loads(data)
+    start = profiler.enter()
+    try:
+        return loads(data)
+    finally:
+        profiler.leave('json', start, len(data))
+
+
+def _render_posts(posts, renderer, output):
+    if not profiler.enabled:
+        output.write(_render_lines(posts, renderer))
+        return
+    start = profiler.enter()
+    text = ''
+    try:
+        text = _render_lines(posts, renderer)
+        output.write(text)
+    finally:
+        profiler.leave('render', start, len(text), len(posts))
+
+
+def _render_lines(posts, renderer):
+    lines = []
+    for post_id, post in posts.items():
+        line = renderer.render(
+                post_id,
+                PostType.from_string(post['type']) if 'type' in post else None,
+                post.get('who'),
+                post.get('content'),
+                post.get('origRoll'),
+                post.get('playerid'),
+                post.get('target'),
+                post.get('target_name'),
+                [
+                    ''.join([roll['expression'], ' = ', str(roll['results']['total'])])
+                    for roll in post.get('inlinerolls', ())
+                ]
+                )
+        if line is not None:
+            lines.append(line)
+    return ''.join(lines)
+
+
+def render_payload(data, output, playerid, is_gm, buffered_limit=None, keep_rows=False):
+    """
+    Renders an already decoded msgdata payload, as kept by the page cache,
+    the same way ChatParser and BufferedChatParser would. Payloads over
+    buffered_limit bytes go through JsonSaxParser.
+    Returns the renderer.
+    """
+    renderer = PostRenderer(playerid, is_gm, keep_rows=keep_rows)
+    if not data:
+        return renderer
+    if buffered_limit is None or len(data) <= buffered_limit:
+        _render_posts(_loads(data), renderer, output)
+    else:
+        json_parser = JsonSaxParser(output, renderer)
+        for i in range(0, len(data), 64 * 1024):
+            json_parser.parse(data[i:i + 64 * 1024])
+        json_parser.close()
+    return renderer
+
+
+def parse_page(data, playerid, is_gm, since=None, buffered_limit=None, raw=None, keep_rows=False):
+    """
+    Parses a whole chatlog page already in memory, for when parsing is done
+    in a worker process. Pages over buffered_limit bytes still go through the
+    streaming parser to keep memory in check.
+    Returns the text of the page, the renderer, which carries what the caller
+    needs to know about the posts, which parser was used and, if raw was
+    given, what raw.close() returned.
+    """
+    output = StringIO()
+    try:
+        if buffered_limit is None or len(data) <= buffered_limit:
+            mode = 'buffered'
+            parser = BufferedChatParser(output, playerid, is_gm, since, raw, keep_rows)
+            parser.process(data)
+        else:
+            mode = 'streamed'
+            parser = ChatParser(output, playerid, is_gm, since, raw, keep_rows)
+            for i in range(0, len(data), 64 * 1024):
+                parser.process(data[i:i + 64 * 1024])
+        parser.finalize()
+        digest = raw.close() if raw is not None else None
+    except:
+        # in a worker process, raw is a copy: the caller can't clean up after it
+        if raw is not None:
+            raw.abort()
+        raise
+    return output.getvalue(), parser.renderer, mode, digest
+
+
+class ArchiveMetadata:
+    """
+    Picks the page count, the current player's ID and whether they are the GM
+    out of a chat archive page as it streams by. done turns True as soon as
+    there is nothing left worth looking for: the window properties are all set
+    before msgdata, so once that shows up a missing is_gm means False.
+
+    Every chunk gets a single search for all of it at once, over the chunk
+    plus just enough of the previous one to catch matches straddling them.
+    """
+
+    RE_METADATA = re_compile(
+            rb'Page 1/(\d+)</div>'
+            rb'|Object\.defineProperty\(window, "currentPlayer", {value: {id: "([^"]{1,64})"}, writable: false }\);'
+            rb'|(Object\.defineProperty\(window, "is_gm", { value : true, writable : false }\);)'
+            rb'|(msgdata)'
+            )
+    # longer than any match can be
+    OVERLAP = 256
+
+    def __init__(self, charset='utf-8'):
+        self._charset = charset
+        self._tail = b''
+        self._seen_msgdata = False
+        self.pages = None
+        self.playerid = None
+        self.is_gm = False
+        self.done = False
+
+
+    def feed(self, chunk):
+        if self.done: return
+        window = self._tail + chunk
+        for match in ArchiveMetadata.RE_METADATA.finditer(window):
+            pages, playerid, is_gm, msgdata = match.groups()
+            if pages:
+                self.pages = int(pages)
+            elif playerid:
+                self.playerid = playerid.decode(self._charset)
+            elif is_gm:
+                self.is_gm = True
+            else:
+                self._seen_msgdata = True
+        self._tail = window[-ArchiveMetadata.OVERLAP :]
+        self.done = self.pages is not None and self.playerid is not None \
+                and (self.is_gm or self._seen_msgdata)
+
+
+    def close(self):
+        self._tail = b''
+        self.done = True
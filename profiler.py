@@ -0,0 +1,144 @@
+"""
+Where the time of a run goes, stage by stage. Each stage adds up the time
+spent in it, how many times it was called, the bytes that went through it
+and, for those that deal in them, the chat messages:
+
+- network: pages waiting for their response and then for each chunk of it
+- decompress: undoing the Content-Encoding of responses
+- lex: going through the page for its msgdata payload
+- base64: decoding the payload
+- json: the JSON parser, stdlib or yajl, whichever is in use
+- render: turning posts into chatlog lines, bytes being characters of text
+- write, cache, archive, database: the chatlog file, the page cache, the
+  archive and the database on disk
+
+Stages nest: time spent in a stage called from the middle of another one,
+like rendering posts as the JSON parser comes across them, only counts for
+the inner one, so the stages add up to where the time actually went. The
+network is the odd one out, as pages wait for it all at once: its time
+overlaps everything else and may well add up to more than the whole run.
+So may the rest with parse_workers, as worker processes report the stages
+of their pages back.
+
+It's all off unless enable() is called. The hooks in the hot paths check
+enabled before doing anything at all.
+
+    python profiler.py PROFILE_JSON
+
+prints the summary of a saved profile again.
+"""
+import json
+from sys import argv
+from time import perf_counter
+
+
+STAGES = ('network', 'decompress', 'lex', 'base64', 'json', 'render', 'write', 'cache', 'archive', 'database')
+
+enabled = False
+_started = None
+# stage -> [seconds, calls, bytes, messages]
+_stages = {}
+# time spent in inner stages, for each stage running right now
+_inner = [0.0]
+
+
+def enable():
+    """Turns profiling on, starting over if it already was."""
+    global enabled, _started
+    enabled = True
+    _started = perf_counter()
+    _stages.clear()
+    _inner[:] = [0.0]
+
+
+def add(stage, seconds, size=0, messages=0):
+    totals = _stages.get(stage)
+    if totals is None:
+        totals = _stages[stage] = [0.0, 0, 0, 0]
+    totals[0] += seconds
+    totals[1] += 1
+    totals[2] += size
+    totals[3] += messages
+
+
+def enter():
+    """
+    Starts timing a stage. Hand what it returns to leave(), from a finally:
+    a stage that raises and never leaves would have every stage after it
+    charged to the wrong one.
+    """
+    _inner.append(0.0)
+    return perf_counter()
+
+
+def leave(stage, start, size=0, messages=0):
+    elapsed = perf_counter() - start
+    add(stage, elapsed - _inner.pop(), size, messages)
+    _inner[-1] += elapsed
+
+
+def merge(stages):
+    """Adds up stages from somewhere else, like a worker process."""
+    for stage, (seconds, calls, size, messages) in stages.items():
+        totals = _stages.setdefault(stage, [0.0, 0, 0, 0])
+        totals[0] += seconds
+        totals[1] += calls
+        totals[2] += size
+        totals[3] += messages
+
+
+def run_profiled(function, *args):
+    """
+    Runs function(*args) in a worker process with profiling on. Returns what
+    it returned along with the stages it went through, for merge().
+    """
+    global enabled
+    enabled = True
+    _stages.clear()
+    return function(*args), dict(_stages)
+
+
+def report():
+    """Everything so far, as it goes in the JSON file."""
+    stages = {}
+    for stage in sorted(_stages, key=lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES)):
+        seconds, calls, size, messages = _stages[stage]
+        stages[stage] = {
+            'seconds': seconds,
+            'calls': calls,
+            'bytes': size,
+            'messages': messages,
+            'mb_s': size / seconds / 1e6 if size and seconds else None,
+            }
+    return {'wall_seconds': perf_counter() - _started if _started is not None else None, 'stages': stages}
+
+
+def summary(report):
+    lines = ['{:<12}{:>10}{:>8}{:>10}{:>10}{:>10}{:>12}'.format('stage', 'seconds', 'share', 'calls', 'MB', 'MB/s', 'messages')]
+    wall = report['wall_seconds']
+    for stage, totals in report['stages'].items():
+        lines.append('{:<12}{:>10.2f}{:>8}{:>10}{:>10.1f}{:>10}{:>12}'.format(
+            stage,
+            totals['seconds'],
+            '{:.0%}'.format(totals['seconds'] / wall) if wall else '',
+            totals['calls'],
+            totals['bytes'] / 1e6,
+            '{:.1f}'.format(totals['mb_s']) if totals['mb_s'] is not None else '',
+            totals['messages'] or ''
+            ))
+    if wall is not None:
+        lines.append('{:.2f}s all told, network overlapping the rest'.format(wall))
+    return '\n'.join(lines)
+
+
+def save(filepath):
+    """Writes the report to filepath as JSON and returns it."""
+    result = report()
+    with open(filepath, 'w') as report_file:
+        json.dump(result, report_file, indent=4)
+    return result
+
+
+if __name__ == '__main__':
+    with open(argv[1]) as report_file:
+        print(summary(json.load(report_file)))
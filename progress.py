@@ -1,12 +1,100 @@
 from sys import stdout
+from time import monotonic
 
 
-def progress(count, total):
-    bar_len = 60
+# name -> (count, total, size) of every progress bar still running
+_tracked = {}
+# name -> when it was first tracked, and its count and size back then
+_started = {}
+_line_len = 0
+
+
+def progress(count, total, rate=''):
+    # leaves room for the rate on an 80 column line
+    bar_len = 60 if not rate else 50
     filled_len = int(round(bar_len * count / float(total)))
 
     percents = round(100.0 * count / float(total), 1)
     bar = '=' * filled_len + '-' * (bar_len - filled_len)
 
-    stdout.write('[%s] %s%s\r' % (bar, percents, '%',))
+    _write('[%s] %s%s%s' % (bar, percents, '%', rate))
+
+
+def track(name, count, total, size=None):
+    """
+    Updates the progress of name. With a single one running this is the usual
+    bar, with more they share the line with a percentage each. size is how
+    many bytes it took to get this far: with it the line also tells how fast
+    they are coming in, all together, and when the last of them should be
+    done.
+    """
+    now = monotonic()
+    if name not in _started:
+        _started[name] = (now, count, size)
+    _tracked[name] = (count, total, size)
+    rate = _rate(now)
+    if len(_tracked) == 1:
+        progress(count, total, rate)
+    else:
+        _write(' | '.join(
+            ['%s %s%%' % (n, round(100.0 * c / float(t), 1)) for n, (c, t, s) in _tracked.items()]
+            + ([rate.strip()] if rate else [])
+            ))
+
+
+def _rate(now):
+    # bytes/s and ETA of everything tracked, counted from when each started
+    # so that whatever was done before (like a resumed export) doesn't count
+    bytes_per_second = 0
+    eta = None
+    for name, (count, total, size) in _tracked.items():
+        started, first_count, first_size = _started[name]
+        elapsed = now - started
+        if size is None or elapsed < 1:
+            continue
+        bytes_per_second += (size - (first_size or 0)) / elapsed
+        if count > first_count:
+            eta = max(eta or 0, (total - count) * elapsed / (count - first_count))
+    if not bytes_per_second:
+        return ''
+    if eta is None:
+        return ' %s/s' % _size(bytes_per_second)
+    return ' %s/s ETA %s' % (_size(bytes_per_second), _duration(eta))
+
+
+def _size(n):
+    for unit in ('B', 'kB', 'MB'):
+        if n < 1000:
+            return '%.1f %s' % (n, unit)
+        n /= 1000
+    return '%.1f GB' % n
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '%d:%02d:%02d' % (hours, minutes, seconds)
+    return '%d:%02d' % (minutes, seconds)
+
+
+def clear():
+    """Blanks the line, for something else to be printed there. The next track() draws it again."""
+    global _line_len
+    if _line_len:
+        stdout.write(' ' * _line_len + '\r')
+        stdout.flush()
+        _line_len = 0
+
+
+def untrack(name):
+    _tracked.pop(name, None)
+    _started.pop(name, None)
+
+
+def _write(line):
+    global _line_len
+    # pad over whatever was left of a longer line
+    stdout.write(line.ljust(_line_len) + '\r')
     stdout.flush()  # As suggested by Rom Ruben (see: http://stackoverflow.com/questions/3173320/text-progress-bar-in-the-console/27871113#comment50529068_27871113)
+    _line_len = len(line)
@@ -1,16 +1,68 @@
 import aiohttp
 import asyncio
 from http import cookies
-from os import path, remove, mkdir, rmdir
-from re import compile as re_compile
+from io import StringIO
+from glob import glob
+from os import makedirs, path, remove, mkdir
+from logging import getLogger
+from random import uniform
+from shutil import rmtree
+from time import perf_counter
+import zlib
 
-from parsers import ChatParser, ParseError
-from progress import progress
+from archive import ArchiveWriter
+from cache import PageCache, PendingIndex
+from checkpoint import Checkpoint
+from database import PostDatabase
+from parsers import ArchiveMetadata, BufferedChatParser, ChatParser, ParseError, Post, parse_page, render_payload
+import profiler
+from progress import clear, track, untrack
+from scheduler import AdaptiveLimiter, ParsePool
+from writer import OrderedWriter
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DECOMPRESSION_ERRORS = (zlib.error,) if brotli is None else (zlib.error, brotli.error)
+
+
+logger = getLogger(__name__)
 
 session = None
-pages = None
-done = None 
+# shared by every chatlog being dumped, see new_session()
+limiter = None
+parse_pool = None
+# see configure()
+page_cache = None
+database = None
+archive_dir = None
+# campaigns being dumped right now: they keep their temporary files by
+# campaign, see _Export
+_exporting = set()
+# where Roll20 is, see configure()
+base_url = 'https://app.roll20.net'
+
+# tuning, see configure()
+buffered_page_limit = 8 * 1024 * 1024
+initial_concurrency = 4
+min_concurrency = 1
+max_concurrency = 16
+latency_tolerance = 2.0
+max_retries = 5
+retry_base_delay = 1.0
+retry_max_delay = 60.0
+connection_limit = 16
+keepalive_timeout = 30.0
+dns_cache_ttl = 300
+compression = True
+parse_workers = 0
+parse_backlog = 2
+reorder_budget = 32 * 1024 * 1024
+
+# statuses Roll20 (or whatever is in front of it) uses to tell us to slow down
+THROTTLE_STATUSES = (429, 503)
 
 
 # oh how i'd love for this exception to fall under HTTPError with a 401
@@ -18,10 +70,20 @@ class LoginError(Exception):
     message = 'Login failed. Please double check your credentials in config.ini.'
 
 
+class CacheMissError(Exception):
+    message = 'No cached copy of this chatlog. Run a full download with "cache = yes" in config.ini first.'
+
+
+class DuplicateExportError(Exception):
+    message = 'The same campaign ID shows up more than once in config.ini.'
+
+
 class HTTPError(Exception):
     _messages = {
         302: 'The login session has timed out. Please restart the program.',
-        403: 'You are not allowed to access this chatlog. Is the ID correct? Are you a member of the campaign?'
+        403: 'You are not allowed to access this chatlog. Is the ID correct? Are you a member of the campaign?',
+        429: 'Roll20 is throttling requests. Try lowering max_concurrency in config.ini.',
+        503: 'Roll20 is unavailable or throttling requests. Try again later.'
         }
         
     def __init__(self, status):
@@ -45,20 +107,64 @@ def _load_rack_session(session, response):
         c.load(set_rack_cookie)
         session.cookie_jar.update_cookies(c)
 
-    assert('rack.session' in session.cookie_jar._cookies['roll20.net'])
+    assert(any(cookie.key == 'rack.session' for cookie in session.cookie_jar))
+
+
+def configure(options):
+    """Picks up tuning knobs from the [options] section of config.ini."""
+    global buffered_page_limit, initial_concurrency, min_concurrency, max_concurrency, latency_tolerance
+    global max_retries, retry_base_delay, retry_max_delay
+    global connection_limit, keepalive_timeout, dns_cache_ttl, compression
+    global parse_workers, parse_backlog, reorder_budget, page_cache, database, archive_dir, base_url
+    buffered_page_limit = options.getint('buffered_page_limit')
+    initial_concurrency = options.getint('initial_concurrency')
+    min_concurrency = options.getint('min_concurrency')
+    max_concurrency = options.getint('max_concurrency')
+    latency_tolerance = options.getfloat('latency_tolerance')
+    max_retries = options.getint('max_retries')
+    retry_base_delay = options.getfloat('retry_base_delay')
+    retry_max_delay = options.getfloat('retry_max_delay')
+    connection_limit = options.getint('connection_limit')
+    keepalive_timeout = options.getfloat('keepalive_timeout')
+    dns_cache_ttl = options.getint('dns_cache_ttl')
+    compression = options.getboolean('compression')
+    parse_workers = options.getint('parse_workers')
+    parse_backlog = options.getint('parse_backlog')
+    reorder_budget = options.getint('reorder_budget')
+    if options.getboolean('cache'):
+        page_cache = PageCache(options['cache_dir'])
+    if options['database']:
+        database = PostDatabase(options['database'])
+    if options['archive_dir']:
+        archive_dir = options['archive_dir']
+        makedirs(archive_dir, exist_ok=True)
+    base_url = options['base_url'].rstrip('/')
+
+
+def _is_retryable(e):
+    # 302 and 403 won't get any better by asking again
+    if isinstance(e, HTTPError):
+        return e.status in THROTTLE_STATUSES or e.status >= 500
+    return isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def _retry_delay(attempt):
+    # exponential backoff with full jitter, so that pages failing together
+    # don't all come back together
+    return uniform(0, min(retry_max_delay, retry_base_delay * 2 ** attempt))
 
 
 async def login(email, password):
     global session
     response = await session.post(
-        'https://app.roll20.net/sessions/create',
+        '{}/sessions/create'.format(base_url),
         data={'email': email, 'password': password},
         allow_redirects=False
         )
 
     # check for successful login. believe it or not this is the only thing that
     # changes in the response if the login failed. i'm speechless.
-    if response.headers['Location'] == 'https://app.roll20.net/sessions/new':
+    if response.headers['Location'] == '{}/sessions/new'.format(base_url):
         raise LoginError
 
     _load_rack_session(session, response)
@@ -68,15 +174,43 @@ async def login(email, password):
     return session
 
 
+def _accept_encoding():
+    if not compression:
+        return 'identity'
+    return 'gzip, deflate, br' if brotli else 'gzip, deflate'
+
+
 async def new_session(email, password):
-    global session
+    global session, limiter, parse_pool
     if session and not session.closed: session.close()
-    session = aiohttp.ClientSession()
+    # everything goes to the same host: keep the connections to it around
+    # and don't look it up again for every one of them
+    connector = aiohttp.TCPConnector(
+            limit=connection_limit,
+            limit_per_host=connection_limit,
+            keepalive_timeout=keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_cache_ttl
+            )
+    # we undo the compression ourselves, see _body()
+    session = aiohttp.ClientSession(
+            connector=connector,
+            headers={'Accept-Encoding': _accept_encoding()},
+            auto_decompress=False
+            )
+    limiter = AdaptiveLimiter(
+            initial_concurrency,
+            min_concurrency,
+            max_concurrency,
+            latency_tolerance
+            )
+    if parse_workers > 0 and parse_pool is None:
+        parse_pool = ParsePool(parse_workers, parse_backlog)
 
     try:
         session.cookie_jar.load('cookiejar')
         response = await session.get(
-            'https://app.roll20.net/account/',
+            '{}/account/'.format(base_url),
             allow_redirects=False
             )
         response.close()
@@ -88,94 +222,776 @@ async def new_session(email, password):
 
 
 async def close_session():
-    await session.close()
+    global parse_pool, database
+    if session is not None:
+        await session.close()
+    if parse_pool is not None:
+        parse_pool.shutdown()
+        parse_pool = None
+    if database is not None:
+        database.close()
+        database = None
 
 
 def delete_cookiejar():
     remove('cookiejar')
 
 
-async def _dump_page(campaign_id, filename, pageno, playerid, is_gm):
-    global session, pages, done
+class _Decompressor:
+    """Undoes the Content-Encoding of a response body a chunk at a time."""
+
+    def __init__(self, encoding):
+        self._sniff = False
+        self._pending = b''
+        if encoding in ('gzip', 'x-gzip'):
+            self._use(zlib.decompressobj(16 + zlib.MAX_WBITS))
+        elif encoding == 'deflate':
+            # supposed to come with a zlib header, but some servers send raw
+            # deflate instead: look at the first two bytes to tell
+            self._sniff = True
+        elif encoding == 'br' and brotli is not None:
+            decompressor = brotli.Decompressor()
+            self._decompress = decompressor.process
+            self._flush = lambda: b''
+        else:
+            raise aiohttp.ClientPayloadError('Unsupported Content-Encoding: {}'.format(encoding))
+
+
+    def decompress(self, data):
+        if self._sniff:
+            data = self._pending + data
+            if len(data) < 2:
+                self._pending = data
+                return b''
+            self._sniff = False
+            zlib_header = data[0] & 0x0f == 8 and (data[0] << 8 | data[1]) % 31 == 0
+            self._use(zlib.decompressobj(zlib.MAX_WBITS if zlib_header else -zlib.MAX_WBITS))
+        try:
+            return self._decompress(data)
+        except DECOMPRESSION_ERRORS as e:
+            raise aiohttp.ClientPayloadError('Bad compressed body: {}'.format(e))
+
+
+    def flush(self):
+        if self._sniff:
+            if self._pending:
+                raise aiohttp.ClientPayloadError('Bad compressed body: truncated')
+            return b''
+        return self._flush()
+
+
+    def _use(self, obj):
+        self._decompress = obj.decompress
+        self._flush = obj.flush
+
+
+async def _body(export, response):
+    """
+    Yields the body of response, decompressed, keeping count in export of
+    the bytes as they came over the wire and as they came out.
+    """
+    encoding = response.headers.get('Content-Encoding', 'identity').strip().lower()
+    decompressor = None if encoding == 'identity' else _Decompressor(encoding)
+    # the time between chunks, whoever is using it, is time spent waiting
+    # for the network: see profiler
+    waiting = perf_counter()
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        export.wire_bytes += len(chunk)
+        if profiler.enabled:
+            profiler.add('network', perf_counter() - waiting, len(chunk))
+        if decompressor is not None:
+            if profiler.enabled:
+                start = profiler.enter()
+                size = len(chunk)
+                try:
+                    chunk = decompressor.decompress(chunk)
+                finally:
+                    profiler.leave('decompress', start, size)
+            else:
+                chunk = decompressor.decompress(chunk)
+        if chunk:
+            export.body_bytes += len(chunk)
+            yield chunk
+        waiting = perf_counter()
+    if decompressor is not None:
+        chunk = decompressor.flush()
+        if chunk:
+            export.body_bytes += len(chunk)
+            yield chunk
+
+
+class _Export:
+    """
+    The state of a single dump_chatlog call, so that several of them can run
+    at once.
+    """
+
+    def __init__(self, name, campaign_id, filepath, since):
+        self.name = name
+        self.campaign_id = campaign_id
+        self.filepath = filepath
+        # no file, no temporary files: see iter_chatlog(). otherwise they go
+        # next to it, named after the campaign rather than the file so that
+        # an export can be resumed under another name, say the next day
+        self.tmp_dir = None
+        if filepath is not None:
+            self.tmp_dir = path.join(path.dirname(filepath), _tmp_dirname(campaign_id, since))
+        self.since = since
+        # the rest is only known once the landing page is in
+        self.pages = None
+        self.playerid = None
+        self.is_gm = None
+        self.done = 0
+        self.page_stats = {'buffered': [], 'streamed': []}
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        # page -> newest post ID in it, for every page parsed
+        self.newest_ids = {}
+        self.writer = None
+        # digests of the pages put in the cache, if they're being cached
+        self.pending_index = None
+        self.archive = None
+        self.posts = None
+
+
+    def filename(self, pageno):
+        return '{}/{}'.format(self.tmp_dir, pageno)
+
+
+    def part_filepath(self):
+        return '{}/part'.format(self.tmp_dir)
+
+
+    def progress(self):
+        track(self.name, self.done, self.pages, self.wire_bytes)
+
+
+def _tmp_dirname(campaign_id, since):
+    # full and incremental exports keep apart: either may be resumed later
+    if since is None:
+        return '{}_tmp'.format(campaign_id)
+    return '{}_since_{}_tmp'.format(campaign_id, since)
+
+
+def _remove_stale_tmp_dirs(export):
+    # once an export is through, whatever an interrupted one it supersedes
+    # left behind is of no more use: a full export supersedes them all, an
+    # incremental one the incremental ones from older watermarks
+    if export.since is None:
+        pattern = '{}_*tmp'.format(export.campaign_id)
+    else:
+        pattern = _tmp_dirname(export.campaign_id, '*')
+    for tmp_dir in glob(path.join(path.dirname(export.filepath), pattern)):
+        logger.debug('%s: removing stale %s', export.name, tmp_dir)
+        rmtree(tmp_dir, ignore_errors=True)
+
+
+class _FirstPage:
+    """
+    The landing page response, read up to the metadata, on its way to
+    becoming page 1. It holds a slot in the limiter until it's done with.
+    """
+
+    def __init__(self, response, chunks, start, latency):
+        self.response = response
+        self.chunks = chunks
+        self.start = start
+        self.latency = latency
+        self._released = False
+
+
+    async def release(self, latency=None):
+        # may end up being called both by its worker and by whoever cancelled
+        # it before it got to run
+        if not self._released:
+            self._released = True
+            self.response.close()
+            await limiter.release(latency)
+
+
+class _PostStream:
+    """
+    The posts of each page on their way to iter_chatlog(), handed over in
+    chronological order as the pages come in, whatever order that is. Like
+    OrderedWriter, minus the file: pages that show up before their turn wait
+    in memory.
+
+    There's no spilling to disk to fall back on, so it's the downloads that
+    have to wait instead: see room().
+    """
+
+    def __init__(self, limit):
+        self._limit = limit
+        # next page due, None until open()
+        self._next = None
+        self._held = {}
+        self._queue = asyncio.Queue()
+        self._space = asyncio.Condition()
+
+
+    def open(self, first):
+        self._next = first
+        self._drain()
+
+
+    def add(self, page, rows):
+        self._held[page] = rows
+        if self._next is not None:
+            self._drain()
+
+
+    def _drain(self):
+        while self._next > 0 and self._next in self._held:
+            self._queue.put_nowait(self._held.pop(self._next))
+            self._next -= 1
+
+
+    async def room(self, page):
+        """
+        Waits until fewer than limit pages are waiting to be taken or for
+        their turn, so that a slow consumer slows the downloads down too.
+        The page due next always gets through, or there'd be no turns.
+        """
+        async with self._space:
+            await self._space.wait_for(
+                    lambda: page == self._next or self._queue.qsize() + len(self._held) < self._limit)
+
+
+    def close(self):
+        self._queue.put_nowait(None)
+
+
+    async def get(self):
+        """The rows of the next page, or None once there are no more."""
+        rows = await self._queue.get()
+        async with self._space:
+            self._space.notify_all()
+        return rows
+
+
+async def _parse_page(export, chunks, pageno, start):
+    raw = page_cache.writer() if export.pending_index is not None else None
+    keep_rows = database is not None or export.archive is not None or export.posts is not None
+    try:
+        text, renderer, mode, digest = await _parse_chunks(export, chunks, raw, keep_rows)
+    except:
+        # whatever made it into the cache is of no use: the page will be
+        # fetched again or the export is off
+        if raw is not None:
+            raw.abort()
+        raise
+    return _page_parsed(export, pageno, mode, start, renderer, text, digest)
+
+
+async def _parse_chunks(export, chunks, raw, keep_rows):
+    # returns the same as parsers.parse_page
+    if parse_pool is not None:
+        return await parse_pool.run(
+                chunks,
+                parse_page,
+                export.playerid,
+                export.is_gm,
+                export.since,
+                buffered_page_limit,
+                raw,
+                keep_rows
+                )
+
+    # hold on to the page as long as it's small enough to be parsed in
+    # one go, otherwise replay what we have into the streaming parser
+    output = StringIO()
+    parser = None
+    buffered_chunks = []
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if parser is None:
+            buffered_chunks.append(chunk)
+            if size > buffered_page_limit:
+                parser = ChatParser(output, export.playerid, export.is_gm, export.since, raw, keep_rows)
+                for buffered_chunk in buffered_chunks:
+                    parser.process(buffered_chunk)
+                buffered_chunks = None
+        else:
+            parser.process(chunk)
+    if parser is None:
+        mode = 'buffered'
+        parser = BufferedChatParser(output, export.playerid, export.is_gm, export.since, raw, keep_rows)
+        for buffered_chunk in buffered_chunks:
+            parser.process(buffered_chunk)
+    else:
+        mode = 'streamed'
+    parser.finalize()
+    digest = raw.close() if raw is not None else None
+    return output.getvalue(), parser.renderer, mode, digest
+
+
+def _page_parsed(export, pageno, mode, start, renderer, text, digest=None):
+    if digest is not None:
+        export.pending_index.add(pageno, digest)
+    if renderer.rows is not None:
+        if database is not None:
+            database.add(export.campaign_id, renderer.rows)
+        if export.archive is not None:
+            export.archive.add(pageno, renderer.rows)
+        if export.posts is not None:
+            export.posts.add(pageno, renderer.rows)
+        renderer.rows = None
+    export.newest_ids[pageno] = renderer.newest_id
+    if export.writer is not None:
+        export.writer.add(pageno, text)
+    elapsed = perf_counter() - start
+    export.page_stats[mode].append(elapsed)
+    # shown along with the rest of --profile, a line per page being too
+    # much for every run. It takes the place of the progress bar, which
+    # export.progress() puts back below it
+    if profiler.enabled:
+        clear()
+        logger.info('%s page %d: %s in %.3fs', export.name, pageno, mode, elapsed)
+    else:
+        logger.debug('%s page %d: %s in %.3fs', export.name, pageno, mode, elapsed)
+    export.done += 1
+    export.progress()
+    return renderer
+
+
+async def _dump_page(export, pageno):
+    global session
+    start = perf_counter()
     response = await session.get(
-            'https://app.roll20.net/campaigns/chatarchive/{}/?p={}'.format(campaign_id, pageno),
+            '{}/campaigns/chatarchive/{}/?p={}'.format(base_url, export.campaign_id, pageno),
             allow_redirects=False
             )
+    latency = perf_counter() - start
+    if profiler.enabled:
+        profiler.add('network', latency)
     async with response:
         if response.status != 200:
             raise HTTPError(response.status)
-        parser = ChatParser(filename, playerid, is_gm)
-        async for chunk in response.content.iter_chunked(64 * 1024):
-            encoding = response.charset or 'utf-8'
-            parser.process(chunk.decode(encoding))
-        parser.finalize()
-    done = done + 1
-    progress(done, pages)
-
-
-async def dump_chatlog(campaign_id, filepath):
-    global session, pages, done
-    is_gm = False
-    response = await session.get(
-            'https://app.roll20.net/campaigns/chatarchive/{}'.format(campaign_id),
-            allow_redirects=False
-            )
+        renderer = await _parse_page(export, _body(export, response), pageno, start)
+    return latency, renderer
 
-    # badly and lazily parse first page for page count and playerid
-    async with response:
-        if response.status != 200:
-            raise HTTPError(response.status)
-        re_pages = re_compile(b'Page 1/(\d+)</div>')
-        re_playerid = re_compile(b'Object\.defineProperty\(window, "currentPlayer", {value: {id: "([^"]+)"}, writable: false }\);')
-        re_isgm = re_compile(b'Object\.defineProperty\(window, "is_gm", { value : true, writable : false }\);')
-        buf = b''
-        # can't use readline because the line with msgdata is too long
-        async for chunk in response.content.iter_any():
-            start = 0
-            buf = b''.join([buf, chunk])
-            while True:
-                end = buf.find(b'\n', start)
-                if end == -1:
-                    buf = buf[start:]
-                    break
-                line = buf[start:end]
-                # NB this does a bunch of pointless work after it finds what
-                # it's looking for already but i cba
-                match_pages = re_pages.search(line)
-                if match_pages:
-                    pages = int(match_pages.group(1))
-                match_playerid = re_playerid.search(line)
-                if match_playerid:
-                    playerid = match_playerid.group(1).decode(response.charset or 'utf-8')
-                match_isgm = re_isgm.search(line)
-                if match_isgm:
-                    is_gm = True
-                start = end + 1
-        del buf
-
-    if not pages: raise ParseError('Page count not found in request body.')
-    if not playerid: raise ParseError('playerid not found in request body.')
-
-    tmp_dir = '{}_tmp'.format(filepath)
+
+async def _dump_page_with_retries(export, pageno):
+    attempt = 0
+    while True:
+        await limiter.acquire()
+        try:
+            latency, renderer = await _dump_page(export, pageno)
+        except Exception as e:
+            throttled = isinstance(e, HTTPError) and e.status in THROTTLE_STATUSES
+            await limiter.release(throttled=throttled)
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_delay(attempt)
+            attempt += 1
+            logger.debug('%s page %d failed (%r), retry %d in %.1fs', export.name, pageno, e, attempt, delay)
+            await asyncio.sleep(delay)
+        except:
+            await limiter.release()
+            raise
+        else:
+            await limiter.release(latency)
+            return renderer
+
+
+async def dump_chatlog(campaign_id, filepath, since=None, name=None):
+    """
+    Saves the chatlog of a campaign to filepath. If since is the ID of a post,
+    only posts newer than it are fetched and saved, and if there are none no
+    file is written at all. name is what the campaign goes by in the progress
+    line, its ID if not given.
+    Several chatlogs can be dumped at once: they share the session and the
+    cap on requests in flight.
+    Returns the ID of the newest post in the chatlog and how many posts were
+    saved.
+    """
+    if campaign_id in _exporting:
+        raise DuplicateExportError
+    _exporting.add(campaign_id)
     try:
-        mkdir(tmp_dir)
+        return await _dump_chatlog(campaign_id, filepath, since, name)
+    finally:
+        _exporting.remove(campaign_id)
+
+
+async def _dump_chatlog(campaign_id, filepath, since, name):
+    export, first_page = await _open_export(campaign_id, filepath, since, name)
+    try:
+        mkdir(export.tmp_dir)
     except:
         pass
-    tasks = []
-    tmp_filepaths = []
-    for page in range(pages, 0, -1):
-        tmp_filepath = '{}/{}'.format(tmp_dir, page)
-        tmp_filepaths.append(tmp_filepath)
-        tasks.append(_dump_page(campaign_id, tmp_filepath, page, playerid, is_gm))
-    done = 0
-    progress(done, pages)
-    await asyncio.gather(*tasks)
+
+    try:
+        if since is None:
+            new_posts = await _dump_all_pages(export, first_page)
+        else:
+            new_posts = await _dump_pages_since(export, first_page)
+    except:
+        if export.writer is not None:
+            export.writer.close()
+        if export.archive is not None:
+            export.archive.close()
+        raise
+    finally:
+        await first_page.release()
+        untrack(export.name)
+
     print('') # for the sake of the progress bar
+    for mode, timings in export.page_stats.items():
+        if timings:
+            print('{}: {} {} page(s), {:.2f}s on average.'.format(
+                export.name, len(timings), mode, sum(timings) / len(timings)))
+    if export.body_bytes:
+        print('{}: {:.1f} MB downloaded, {:.1f} MB decompressed ({:.0%} saved).'.format(
+            export.name,
+            export.wire_bytes / 1e6,
+            export.body_bytes / 1e6,
+            1 - export.wire_bytes / export.body_bytes))
+
+    if since is None or new_posts:
+        export.writer.commit()
+    else:
+        export.writer.discard()
+    if export.archive is not None:
+        export.archive.commit()
+    rmtree(export.tmp_dir)
+    _remove_stale_tmp_dirs(export)
+
+    newest = max((i for i in export.newest_ids.values() if i is not None), default=since)
+    return newest, new_posts
+
+
+async def iter_chatlog(campaign_id, since=None, name=None):
+    """
+    Yields the posts of the chatlog of a campaign as parsers.Post records,
+    oldest first, as the pages come in: the posts of a page are out as soon
+    as it and every older page are in. If since is the ID of a post, only
+    posts newer than it are yielded, and only once the pages have been
+    walked back to it.
+    Nothing is written anywhere, but for the database if there is one.
+    Same rules as dump_chatlog for running several at once, and a campaign
+    can't be iterated while it's being dumped or the other way around.
+    Downloads keep at most max_concurrency pages ahead of the caller.
+    """
+    if campaign_id in _exporting:
+        raise DuplicateExportError
+    _exporting.add(campaign_id)
+    try:
+        export, first_page = await _open_export(campaign_id, None, since, name)
+        export.posts = _PostStream(max_concurrency)
+
+        async def download():
+            try:
+                if since is None:
+                    export.posts.open(export.pages)
+                    await _fetch_pages(export, first_page)
+                else:
+                    page = (await _walk_pages_since(export, first_page))[1]
+                    export.posts.open(page)
+            finally:
+                export.posts.close()
+
+        task = asyncio.ensure_future(download())
+        try:
+            while True:
+                rows = await export.posts.get()
+                if rows is None:
+                    break
+                for row in rows:
+                    yield Post(*row)
+            # whatever cut the download short
+            await task
+        finally:
+            # when the caller stops early, let the pages in flight wind down
+            # before returning
+            task.cancel()
+            await asyncio.wait([task])
+            await first_page.release()
+            untrack(export.name)
+    finally:
+        _exporting.remove(campaign_id)
+
 
-    with open(filepath, 'w') as output_file:
-        for i in range(pages):
-            with open(tmp_filepaths[i]) as input_file:
-                for line in input_file:
-                    output_file.write(line)
-            remove(tmp_filepaths[i])
-    rmdir(tmp_dir)
+async def _open_export(campaign_id, filepath, since, name):
+    # gets the landing page of a chatlog far enough to know what's in it.
+    # returns the export and the rest of the landing page, see _FirstPage
+    global session
+    # the landing page holds its slot until page 1 is parsed, see
+    # _dump_first_page
+    await limiter.acquire()
+    start = perf_counter()
+    try:
+        response = await session.get(
+                '{}/campaigns/chatarchive/{}'.format(base_url, campaign_id),
+                allow_redirects=False
+                )
+    except:
+        await limiter.release()
+        raise
+    latency = perf_counter() - start
+    if profiler.enabled:
+        profiler.add('network', latency)
+    if response.status != 200:
+        response.close()
+        await limiter.release(throttled=response.status in THROTTLE_STATUSES)
+        raise HTTPError(response.status)
+
+    # the landing page is page 1: read only as much of it as it takes to get
+    # the metadata, keep what was read for page 1 and let the rest stream
+    # into its parser later
+    export = _Export(name or campaign_id, campaign_id, filepath, since)
+    metadata = ArchiveMetadata(response.charset or 'utf-8')
+    chunks = _body(export, response)
+    held = []
+    try:
+        async for chunk in chunks:
+            held.append(chunk)
+            metadata.feed(chunk)
+            if metadata.done:
+                break
+        else:
+            metadata.close()
+        if not metadata.pages:
+            raise ParseError('Page count not found in request body.')
+        if not metadata.playerid:
+            raise ParseError('playerid not found in request body.')
+    except:
+        response.close()
+        await limiter.release()
+        raise
+
+    async def first_page_chunks():
+        for chunk in held:
+            yield chunk
+        async for chunk in chunks:
+            yield chunk
+
+    first_page = _FirstPage(response, first_page_chunks(), start, latency)
+    export.pages = metadata.pages
+    export.playerid = metadata.playerid
+    export.is_gm = metadata.is_gm
+    return export, first_page
+
+
+async def _dump_first_page(export, first_page):
+    # carry on with the landing page response rather than downloading page 1
+    # all over again. if it breaks halfway, that's what retries are for
+    try:
+        renderer = await _parse_page(export, first_page.chunks, 1, first_page.start)
+    except Exception as e:
+        await first_page.release()
+        if not _is_retryable(e):
+            raise
+        logger.debug('%s page 1 from the landing page failed (%r), fetching it again', export.name, e)
+    except:
+        await first_page.release()
+        raise
+    else:
+        await first_page.release(first_page.latency)
+        return renderer
+    return await _dump_page_with_retries(export, 1)
+
+
+def _resume_point(checkpoint, pages, part_filepath):
+    # pages already in the output file are the ones from the last down in a
+    # row, as long as the file didn't get any shorter in the meantime.
+    # Returns the first page still to write and how much of the .part file
+    # to keep
+    first, offset = pages, 0
+    while first in checkpoint.offsets:
+        offset = checkpoint.offsets[first]
+        first -= 1
+    if not path.exists(part_filepath) or path.getsize(part_filepath) < offset:
+        return pages, 0
+    return first, offset
+
+
+async def _dump_all_pages(export, first_page):
+    checkpoint = Checkpoint('{}/manifest'.format(export.tmp_dir), export.pages)
+    export.writer = OrderedWriter(
+            export.filepath,
+            export.tmp_dir,
+            reorder_budget,
+            lambda page, offset: checkpoint.add(page, export.newest_ids[page], offset),
+            export.part_filepath()
+            )
+    first, offset = _resume_point(checkpoint, export.pages, export.writer.part_filepath)
+    # the rest only count if they were spilled and are still there
+    checkpoint.open(lambda page: page > first or path.exists(export.filename(page)))
+    export.newest_ids.update(checkpoint.done)
+    export.writer.open(first, offset, [page for page in checkpoint.done if page <= first])
+    if page_cache is not None:
+        export.pending_index = PendingIndex(
+                '{}/cache_index'.format(export.tmp_dir),
+                lambda page, digest: page in checkpoint.done and page_cache.has(digest)
+                )
+    if archive_dir is not None:
+        export.archive = ArchiveWriter(
+                archive_dir,
+                export.campaign_id,
+                '{}/archive_pending'.format(export.tmp_dir),
+                lambda page: page in checkpoint.done
+                )
+    if checkpoint.done:
+        print('{}: resuming, {} of {} pages already saved.'.format(
+            export.name, len(checkpoint.done), export.pages))
+    try:
+        new_posts = await _fetch_pages(export, first_page, checkpoint.done)
+    finally:
+        checkpoint.close()
+        if export.pending_index is not None:
+            export.pending_index.close()
+
+    if export.pending_index is not None:
+        digests = export.pending_index.digests
+        if len(digests) == export.pages:
+            page_cache.save_index(export.campaign_id, export.pages, export.playerid, export.is_gm, digests)
+        else:
+            print('{}: some pages were saved before the cache was turned on, so it was left alone.'.format(export.name))
+    return new_posts
+
+
+async def _fetch_pages(export, first_page, done=()):
+    # every page of the chatlog but those in done, all at once. returns how
+    # many posts they had
+    queue = asyncio.Queue()
+    for page in range(export.pages, 1, -1):
+        if page not in done:
+            queue.put_nowait(page)
+    new_posts = 0
+
+    async def first_page_worker():
+        nonlocal new_posts
+        if 1 in done:
+            await first_page.release()
+            return
+        renderer = await _dump_first_page(export, first_page)
+        new_posts += renderer.new_posts
+
+    async def worker():
+        nonlocal new_posts
+        while not queue.empty():
+            page = queue.get_nowait()
+            if export.posts is not None:
+                await export.posts.room(page)
+            renderer = await _dump_page_with_retries(export, page)
+            new_posts += renderer.new_posts
+
+    export.done = len(done)
+    export.progress()
+    # as many workers as could ever run at once: the limiter decides how many
+    # actually do
+    workers = [asyncio.ensure_future(worker()) for _ in range(max_concurrency)]
+    workers.append(asyncio.ensure_future(first_page_worker()))
+    try:
+        await asyncio.gather(*workers)
+    except:
+        for w in workers:
+            w.cancel()
+        raise
+    return new_posts
+
+
+def render_cached_chatlog(campaign_id, filepath, name=None):
+    """
+    Saves the chatlog of a campaign to filepath like dump_chatlog, but from
+    the page cache alone, as of the last full download with the cache on.
+    Nothing goes over the network.
+    Returns the ID of the newest post in the chatlog and how many posts were
+    saved.
+    """
+    index = page_cache.load_index(campaign_id) if page_cache is not None else None
+    if index is None:
+        raise CacheMissError
+    pages, playerid, is_gm, digests = index
+    name = name or campaign_id
+    writer = OrderedWriter(filepath, None, 0)
+    writer.open(pages)
+    newest_id = None
+    posts = 0
+    try:
+        for done, page in enumerate(range(pages, 0, -1), 1):
+            output = StringIO()
+            renderer = render_payload(
+                    page_cache.read(digests[page]),
+                    output,
+                    playerid,
+                    is_gm,
+                    buffered_page_limit,
+                    database is not None
+                    )
+            if renderer.rows:
+                database.add(campaign_id, renderer.rows)
+            writer.add(page, output.getvalue())
+            if renderer.newest_id is not None and (newest_id is None or renderer.newest_id > newest_id):
+                newest_id = renderer.newest_id
+            posts += renderer.new_posts
+            track(name, done, pages)
+    except:
+        writer.close()
+        raise
+    finally:
+        untrack(name)
+    writer.commit()
+    print('')
+    return newest_id, posts
+
+
+def prune_cache():
+    """Drops whatever the page cache no longer needs. Only call it with no downloads running."""
+    if page_cache is not None:
+        page_cache.prune()
+
+
+async def _dump_pages_since(export, first_page):
+    # only once we get to the watermark do we know which page goes first in
+    # the file
+    export.writer = OrderedWriter(export.filepath, export.tmp_dir, reorder_budget, part_filepath=export.part_filepath())
+    if archive_dir is not None:
+        export.archive = ArchiveWriter(
+                archive_dir,
+                export.campaign_id,
+                '{}/archive_pending'.format(export.tmp_dir),
+                lambda page: False
+                )
+    new_posts, page = await _walk_pages_since(export, first_page)
+    export.writer.open(page)
+    return new_posts
+
+
+async def _walk_pages_since(export, first_page):
+    # newest posts are on page 1: walk back from there until the watermark.
+    # it's usually on page 1 itself. If it isn't it may be anywhere, as far
+    # back as before the first page, so the rest go concurrently like a full
+    # export, just oldest last: no page past the first one found to reach
+    # the watermark gets started, the ones already in flight being all it
+    # overshoots by.
+    # returns how many posts are newer and the last page walked
+    export.progress()
+    renderer = await _dump_first_page(export, first_page)
+    if renderer.reached_since:
+        return renderer.new_posts, 1
+    new_posts = renderer.new_posts
+    pages = iter(range(2, export.pages + 1))
+    last = export.pages
+
+    async def worker():
+        nonlocal new_posts, last
+        for page in pages:
+            if page > last:
+                return
+            renderer = await _dump_page_with_retries(export, page)
+            new_posts += renderer.new_posts
+            if renderer.reached_since:
+                last = min(last, page)
+
+    # as in _fetch_pages, the limiter decides how many actually run
+    workers = [asyncio.ensure_future(worker()) for _ in range(max_concurrency)]
+    try:
+        await asyncio.gather(*workers)
+    except:
+        for w in workers:
+            w.cancel()
+        raise
+    return new_posts, last
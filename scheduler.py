@@ -0,0 +1,113 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from logging import getLogger
+
+import profiler
+
+
+logger = getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """
+    Caps how many requests are in flight at once, moving the cap within
+    [minimum, maximum] depending on how the server is coping.
+
+    The cap grows by one after a cap's worth of healthy responses in a row and
+    shrinks by one whenever the (smoothed) time to first byte drifts past
+    latency_tolerance times the best seen so far. Being throttled outright
+    halves it.
+    """
+
+    def __init__(self, initial, minimum, maximum, latency_tolerance=2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self._latency_tolerance = latency_tolerance
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+        self._smoothed_latency = None
+        self._best_latency = None
+        self._healthy = 0
+
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+
+    async def release(self, latency=None, throttled=False):
+        async with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self._set_limit(self.limit // 2)
+            elif latency is not None:
+                self._observe(latency)
+            self._condition.notify_all()
+
+
+    def _observe(self, latency):
+        if self._smoothed_latency is None:
+            self._smoothed_latency = latency
+        else:
+            self._smoothed_latency = 0.8 * self._smoothed_latency + 0.2 * latency
+        if self._best_latency is None or self._smoothed_latency < self._best_latency:
+            self._best_latency = self._smoothed_latency
+
+        if self._smoothed_latency > self._best_latency * self._latency_tolerance:
+            self._set_limit(self.limit - 1)
+        else:
+            self._healthy += 1
+            if self._healthy >= self.limit:
+                self._set_limit(self.limit + 1)
+
+
+    def _set_limit(self, limit):
+        limit = max(self.minimum, min(limit, self.maximum))
+        if limit != self.limit:
+            logger.debug('concurrency %d -> %d', self.limit, limit)
+            self.limit = limit
+        self._healthy = 0
+
+
+class ParsePool:
+    """
+    Parses chatlog pages in worker processes, so the event loop is free to
+    keep downloading while they crunch.
+
+    Only so many pages may be in the pipeline at once, being read into memory
+    or waiting for or being parsed by a worker: a page that doesn't fit waits
+    before its body is read at all, which in turn holds up its download.
+    """
+
+    def __init__(self, workers, backlog):
+        self._executor = ProcessPoolExecutor(workers)
+        self._slots = asyncio.Semaphore(workers + backlog)
+
+
+    async def run(self, chunks, function, *args):
+        """Reads chunks into memory, then runs function(data, *args) in a worker."""
+        async with self._slots:
+            body = []
+            async for chunk in chunks:
+                body.append(chunk)
+            data = b''.join(body)
+            body = None
+            if not profiler.enabled:
+                return await asyncio.get_event_loop().run_in_executor(
+                        self._executor,
+                        partial(function, data, *args)
+                        )
+            # the stages of the page happen in the worker: bring them back
+            result, stages = await asyncio.get_event_loop().run_in_executor(
+                    self._executor,
+                    partial(profiler.run_profiled, function, data, *args)
+                    )
+            profiler.merge(stages)
+            return result
+
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
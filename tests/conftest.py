@@ -0,0 +1,8 @@
+from os import path
+from sys import path as sys_path
+
+# the modules under test sit at the top of the repo, and the synthetic pages
+# come from benchmarks/synthetic.py
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys_path.insert(0, ROOT)
+sys_path.insert(0, path.join(ROOT, 'benchmarks'))
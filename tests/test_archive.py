@@ -0,0 +1,36 @@
+"""
+What goes into the archive has to come back out just as PostRenderer kept
+it: the same types, None where there was None.
+"""
+from archive import ArchiveReader, ArchiveWriter
+from parsers import parse_page
+
+import synthetic
+
+
+def write(directory, rows, page=1):
+    writer = ArchiveWriter(str(directory), '1', str(directory / 'pending'), lambda page: True)
+    writer.add(page, rows)
+    writer.commit()
+
+
+def test_rows_come_back_as_they_went_in(tmp_path):
+    page = synthetic.make_page(500, rolls=0.5, whispers=0.2)
+    rows = parse_page(page, synthetic.PLAYERID, True, keep_rows=True)[1].rows
+    assert any(isinstance(row[6], int) for row in rows)
+    write(tmp_path, rows)
+    with ArchiveReader(str(tmp_path), '1') as reader:
+        assert reader[:] == sorted(rows)
+
+
+def test_none_and_empty_stay_apart(tmp_path):
+    rows = [
+        ('-M0000000001', 'general', None, None, None, 'no speaker', None),
+        ('-M0000000002', 'general', '', '', '', '', None),
+        ('-M0000000003', 'rollresult', 'A', '-Mother1', None, '1d20', 14),
+        ('-M0000000004', 'rollresult', 'A', '-Mother1', None, '1d20/2', 2.5),
+        ]
+    write(tmp_path, rows)
+    with ArchiveReader(str(tmp_path), '1') as reader:
+        assert reader[:] == rows
+        assert reader.find('-M0000000003') == 2
@@ -0,0 +1,48 @@
+"""
+Pages that fail halfway must not leave anything behind in the page cache.
+"""
+from base64 import b64encode
+from os import listdir
+
+import pytest
+
+from cache import PageCache
+from parsers import ParseError, parse_page
+
+import synthetic
+
+
+def test_abort_after_write(tmp_path):
+    cache = PageCache(str(tmp_path))
+    writer = cache.writer()
+    writer.write(b'{"half": ')
+    assert len(listdir(cache._objects_dir)) == 1
+    writer.abort()
+    assert listdir(cache._objects_dir) == []
+    # nothing written yet, nothing to do
+    cache.writer().abort()
+
+
+def test_failed_page_leaves_nothing(tmp_path):
+    cache = PageCache(str(tmp_path))
+    # good JSON for a while, then garbage: the streaming parser writes to
+    # the cache as it goes and only then finds out
+    payload = synthetic.make_payload(2000)[:-1] + b', !!!}'
+    page = b'<script>var msgdata = "' + b64encode(payload) + b'";</script>'
+    with pytest.raises(ParseError):
+        parse_page(page, synthetic.PLAYERID, False, buffered_limit=0, raw=cache.writer())
+    assert listdir(cache._objects_dir) == []
+
+
+def test_prune_sweeps_leftovers(tmp_path):
+    cache = PageCache(str(tmp_path))
+    writer = cache.writer()
+    writer.write(b'{}')
+    # as if the program had crashed right here
+    writer._file.close()
+    digest = cache.writer()
+    digest.write(b'{}')
+    digest = digest.close()
+    cache.save_index('1', 1, synthetic.PLAYERID, False, {1: digest})
+    cache.prune()
+    assert listdir(cache._objects_dir) == ['{}.json.gz'.format(digest)]
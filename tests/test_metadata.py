@@ -0,0 +1,80 @@
+"""
+ArchiveMetadata has to find everything however the page is cut up, matches
+straddling two or more chunks included.
+"""
+import pytest
+
+from parsers import ArchiveMetadata
+
+import synthetic
+
+
+PAGES = 1234
+MARKERS = [b'Page 1/', b'"currentPlayer"', b'"is_gm"', b'msgdata']
+
+
+def page(is_gm):
+    return synthetic.make_page(5, pages=PAGES, is_gm=is_gm)
+
+
+def feed(chunks):
+    metadata = ArchiveMetadata()
+    for chunk in chunks:
+        metadata.feed(chunk)
+        if metadata.done:
+            break
+    else:
+        metadata.close()
+    return metadata
+
+
+def check(metadata, is_gm):
+    assert metadata.done
+    assert metadata.pages == PAGES
+    assert metadata.playerid == synthetic.PLAYERID
+    assert metadata.is_gm == is_gm
+
+
+def split(data, cuts):
+    cuts = [0] + sorted(set(cut for cut in cuts if 0 < cut < len(data))) + [len(data)]
+    return [data[start:stop] for start, stop in zip(cuts, cuts[1:])]
+
+
+@pytest.mark.parametrize('is_gm', [False, True])
+def test_whole_page(is_gm):
+    check(feed([page(is_gm)]), is_gm)
+
+
+@pytest.mark.parametrize('is_gm', [False, True])
+def test_one_byte_chunks(is_gm):
+    data = page(is_gm)
+    check(feed(data[i:i + 1] for i in range(len(data))), is_gm)
+
+
+@pytest.mark.parametrize('is_gm', [False, True])
+def test_every_chunk_size(is_gm):
+    data = page(is_gm)
+    for size in range(1, 301):
+        check(feed(data[i:i + size] for i in range(0, len(data), size)), is_gm)
+
+
+@pytest.mark.parametrize('is_gm', [False, True])
+def test_splits_across_the_overlap(is_gm):
+    data = page(is_gm)
+    for marker in MARKERS:
+        at = data.find(marker)
+        if at == -1:
+            assert marker == b'"is_gm"' and not is_gm
+            continue
+        # a cut anywhere near the marker, then a second one right after it
+        # or about an overlap's worth further on, so that matches run over
+        # into a third chunk
+        for cut in range(at - 8, at + 120):
+            for gap in (1, 2, ArchiveMetadata.OVERLAP - 1, ArchiveMetadata.OVERLAP, ArchiveMetadata.OVERLAP + 1):
+                check(feed(split(data, [cut, cut + gap])), is_gm)
+
+
+def test_missing_metadata():
+    # no msgdata: only close() says there's nothing more to come
+    metadata = feed([b'<html>Page 1/3</div></html>'])
+    assert metadata.done and metadata.pages == 3 and metadata.playerid is None
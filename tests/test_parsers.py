@@ -0,0 +1,58 @@
+"""
+The buffered and the streaming parser must agree on everything they hand
+back, not just the text: the rows go to the database, the archive and
+iter_chatlog.
+"""
+from base64 import b64encode
+
+import pytest
+
+from parsers import ParseError, PostRenderer, PostType, parse_page
+
+import synthetic
+
+
+@pytest.mark.parametrize('is_gm', [False, True])
+@pytest.mark.parametrize('since', [None, '-M{:010d}'.format(1500)])
+def test_buffered_and_streamed_agree(is_gm, since):
+    page = synthetic.make_page(3000, is_gm=is_gm, whispers=0.2)
+    buffered = parse_page(page, synthetic.PLAYERID, is_gm, since, keep_rows=True)
+    # a limit of 0 sends every page through the streaming parser
+    streamed = parse_page(page, synthetic.PLAYERID, is_gm, since, buffered_limit=0, keep_rows=True)
+    assert buffered[2] == 'buffered' and streamed[2] == 'streamed'
+    assert streamed[0] == buffered[0]
+    assert streamed[1].rows == buffered[1].rows
+    assert streamed[1].newest_id == buffered[1].newest_id
+    assert streamed[1].new_posts == buffered[1].new_posts
+
+
+def test_target_name_only_on_whispers():
+    page = synthetic.make_page(500, whispers=0.2)
+    rows = parse_page(page, synthetic.PLAYERID, False, buffered_limit=0, keep_rows=True)[1].rows
+    assert any(row[1] == 'whisper' for row in rows)
+    for post_id, type, who, playerid, target_name, content, total in rows:
+        assert (target_name is not None) == (type == 'whisper')
+
+
+def test_hidden_posts_are_not_new():
+    renderer = PostRenderer(synthetic.PLAYERID, False, since='-M0000000000', keep_rows=True)
+    # an API post and whispers and a GM roll between other players
+    assert renderer.render('-M0000000001', PostType.from_string('api'), 'API', 'x', None, '-Mother1', None, None, []) is None
+    assert renderer.render('-M0000000002', PostType.WHISPER, 'A', 'psst', None, '-Mother1', '-Mother2', 'B', []) is None
+    assert renderer.render('-M0000000003', PostType.GMROLLRESULT, 'A', '{"total": 3}', '1d4', '-Mother1', None, None, []) is None
+    assert renderer.new_posts == 0
+    assert renderer.rows == []
+    assert renderer.newest_id == '-M0000000003'
+    assert renderer.render('-M0000000004', PostType.GENERAL, 'A', 'hi', None, '-Mother1', None, None, []) == 'A: hi\n'
+    assert renderer.new_posts == 1
+
+
+@pytest.mark.parametrize('buffered_limit', [None, 0])
+def test_bad_payload_raises_parse_error(buffered_limit):
+    # both paths fail alike, and as an exception the callers can handle
+    payload = synthetic.make_payload(200)[:-1] + b', !!!}'
+    page = b'<script>var msgdata = "' + b64encode(payload) + b'";</script>'
+    kwargs = {} if buffered_limit is None else {'buffered_limit': buffered_limit}
+    with pytest.raises(ParseError) as raised:
+        parse_page(page, synthetic.PLAYERID, False, **kwargs)
+    assert raised.value.__cause__ is not None
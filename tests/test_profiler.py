@@ -0,0 +1,51 @@
+"""
+Stages that fail or stop halfway must still leave, or every stage after them
+gets charged to the wrong one.
+"""
+from base64 import b64encode
+
+import pytest
+
+from parsers import ParseError, parse_page
+from writer import OrderedWriter
+import profiler
+
+import synthetic
+
+
+@pytest.fixture
+def profiling():
+    profiler.enable()
+    yield
+    profiler.enabled = False
+
+
+@pytest.mark.parametrize('buffered_limit', [None, 0])
+def test_failed_parse_leaves_every_stage(profiling, buffered_limit):
+    payload = synthetic.make_payload(200)[:-1] + b', !!!}'
+    page = b'<script>var msgdata = "' + b64encode(payload) + b'";</script>'
+    kwargs = {} if buffered_limit is None else {'buffered_limit': buffered_limit}
+    with pytest.raises(ParseError):
+        parse_page(page, synthetic.PLAYERID, False, **kwargs)
+    assert len(profiler._inner) == 1
+
+
+def test_stalled_writer_leaves(profiling, tmp_path):
+    writer = OrderedWriter(str(tmp_path / 'out.txt'), str(tmp_path), 1e9)
+    writer.open(3)
+    # nothing to write until page 3 shows up
+    writer.add(1, 'one\n')
+    writer.add(2, 'two\n')
+    writer.add(3, 'three\n')
+    writer.commit()
+    assert len(profiler._inner) == 1
+    assert profiler.report()['stages']['write']['calls'] == 3
+
+
+def test_nested_stages_add_up(profiling):
+    page = synthetic.make_page(500)
+    parse_page(page, synthetic.PLAYERID, False, buffered_limit=0)
+    assert len(profiler._inner) == 1
+    stages = profiler.report()['stages']
+    assert set(stages) >= {'lex', 'base64', 'json', 'render'}
+    assert stages['render']['messages'] == 500
@@ -0,0 +1,236 @@
+"""
+The download side of roll20.py, against mock_roll20.py running in the same
+event loop.
+"""
+import asyncio
+import gzip
+import zlib
+from configparser import ConfigParser
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import config
+import roll20
+
+from mock_roll20 import MockRoll20
+import synthetic
+
+
+def run(mock, test, **overrides):
+    """Runs test() with a session logged in to mock, from the current directory."""
+    async def main():
+        runner = web.AppRunner(mock.app())
+        await runner.setup()
+        site = web.TCPSite(runner, 'localhost', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        options = ConfigParser()
+        options.read_dict(config.defaults)
+        options['options']['base_url'] = 'http://localhost:{}'.format(port)
+        for key, value in overrides.items():
+            options['options'][key] = str(value)
+        roll20.configure(options['options'])
+        try:
+            await roll20.new_session('test@example.com', 'test')
+            return await test()
+        finally:
+            await roll20.close_session()
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def compress(encoding, data):
+    if encoding == 'gzip':
+        return gzip.compress(data)
+    if encoding == 'deflate':
+        return zlib.compress(data)
+    if encoding == 'raw deflate':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    return roll20.brotli.compress(data)
+
+
+def decompress(encoding, body, size):
+    decompressor = roll20._Decompressor('deflate' if encoding == 'raw deflate' else encoding)
+    parts = [decompressor.decompress(body[i:i + size]) for i in range(0, len(body), size)]
+    return b''.join(parts) + decompressor.flush()
+
+
+PAGE = synthetic.make_page(200)
+
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    # the cookiejar goes in the current directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_post_stream_backpressure():
+    async def main():
+        stream = roll20._PostStream(2)
+        stream.open(5)
+        # pages 3 and 4 wait for page 5: no room for anything but page 5
+        stream.add(3, ['c'])
+        stream.add(4, ['d'])
+        waiting = asyncio.ensure_future(stream.room(2))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        await asyncio.wait_for(stream.room(5), 1)
+        # page 5 lets all three through to the queue, still too many
+        stream.add(5, ['e'])
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        assert await stream.get() == ['e']
+        assert await stream.get() == ['d']
+        # down to one: page 2 gets its turn to download
+        await asyncio.wait_for(waiting, 1)
+        assert await stream.get() == ['c']
+        stream.close()
+        assert await stream.get() is None
+    asyncio.run(main())
+
+
+def test_iter_chatlog_in_order(scratch):
+    mock = MockRoll20(pages=6, posts=50)
+
+    async def test():
+        await roll20.dump_chatlog('1', str(scratch / 'out.txt'))
+        return [post async for post in roll20.iter_chatlog('1')]
+
+    posts = run(mock, test, max_concurrency=3)
+    assert [post.id for post in posts] == sorted(post.id for post in posts)
+    with open(str(scratch / 'out.txt')) as output:
+        assert ''.join(post.line() for post in posts) == output.read()
+
+
+def test_iter_chatlog_stopped_early(scratch):
+    mock = MockRoll20(pages=40, posts=50)
+
+    async def test():
+        posts = roll20.iter_chatlog('1')
+        async for post in posts:
+            break
+        await posts.aclose()
+        # nothing left running, no slot held, and free to go again
+        assert not [task for task in asyncio.all_tasks() if task.get_coro().cr_code.co_filename == roll20.__file__]
+        assert roll20.limiter._in_flight == 0
+        assert '1' not in roll20._exporting
+        posts = roll20.iter_chatlog('1')
+        try:
+            return await posts.__anext__()
+        finally:
+            await posts.aclose()
+
+    assert run(mock, test, max_concurrency=4) is not None
+    # the caller fell behind right away: pages stopped coming soon after
+    assert mock.stats['pages'] < 40
+
+
+def test_iter_chatlog_excludes_dump(scratch):
+    mock = MockRoll20(pages=4, posts=20)
+
+    async def test():
+        posts = roll20.iter_chatlog('1')
+        await posts.__anext__()
+        try:
+            with pytest.raises(roll20.DuplicateExportError):
+                await roll20.dump_chatlog('1', str(scratch / 'out.txt'))
+            with pytest.raises(roll20.DuplicateExportError):
+                await roll20.iter_chatlog('1').__anext__()
+        finally:
+            await posts.aclose()
+
+    run(mock, test)
+
+
+@pytest.mark.parametrize('encoding', [
+    'gzip',
+    'deflate',
+    'raw deflate',
+    pytest.param('br', marks=pytest.mark.skipif(roll20.brotli is None, reason='brotli is not installed')),
+    ])
+@pytest.mark.parametrize('size', [1, 2, 3, 1000, 64 * 1024, 10 ** 6])
+def test_decompressor_in_chunks(encoding, size):
+    assert decompress(encoding, compress(encoding, PAGE), size) == PAGE
+
+
+def test_decompressor_x_gzip():
+    assert decompress('x-gzip', gzip.compress(PAGE), 1000) == PAGE
+
+
+@pytest.mark.parametrize('encoding', ['compress', 'zstd', 'identity, gzip'])
+def test_decompressor_unknown_encoding(encoding):
+    with pytest.raises(aiohttp.ClientPayloadError):
+        roll20._Decompressor(encoding)
+
+
+@pytest.mark.skipif(roll20.brotli is not None, reason='brotli is installed')
+def test_decompressor_brotli_missing():
+    # _accept_encoding() doesn't ask for it, so a server sending it anyway is an error
+    with pytest.raises(aiohttp.ClientPayloadError):
+        roll20._Decompressor('br')
+
+
+# raw deflate has no checksum: garbage in the middle may well decode to
+# garbage without anything noticing
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+def test_decompressor_bad_body(encoding):
+    body = bytearray(compress(encoding, PAGE))
+    body[len(body) // 2:len(body) // 2 + 8] = b'\xff' * 8
+    with pytest.raises(aiohttp.ClientPayloadError):
+        decompress(encoding, bytes(body), 1000)
+
+
+def test_decompressor_deflate_cut_short():
+    decompressor = roll20._Decompressor('deflate')
+    assert decompressor.decompress(b'x') == b''
+    with pytest.raises(aiohttp.ClientPayloadError):
+        decompressor.flush()
+
+
+def peak_in_flight(mock):
+    peak = [0]
+    page = mock.page
+
+    def counting(*args):
+        peak[0] = max(peak[0], mock._in_flight)
+        return page(*args)
+
+    mock.page = counting
+    return peak
+
+
+def test_since_older_than_every_page(scratch):
+    mock = MockRoll20(pages=12, posts=50, latency=0.02)
+
+    async def test():
+        await roll20.dump_chatlog('1', str(scratch / 'full.txt'))
+        peak = peak_in_flight(mock)
+        # post IDs all start with -M
+        await roll20.dump_chatlog('1', str(scratch / 'since.txt'), since='-L')
+        return peak[0]
+
+    # every page is needed, so they go concurrently rather than one by one
+    assert run(mock, test, max_concurrency=4, initial_concurrency=4) > 1
+    with open(str(scratch / 'full.txt')) as full, open(str(scratch / 'since.txt')) as since:
+        assert since.read() == full.read()
+
+
+def test_since_a_few_pages_back(scratch):
+    mock = MockRoll20(pages=12, posts=50, latency=0.02)
+    # halfway through page 3
+    since = '-M{:010d}'.format((12 - 3) * 50 + 25)
+
+    async def test():
+        everything = [post async for post in roll20.iter_chatlog('1')]
+        pages = mock.stats['pages']
+        newer = [post async for post in roll20.iter_chatlog('1', since=since)]
+        return everything, newer, mock.stats['pages'] - pages
+
+    everything, newer, pages = run(mock, test, max_concurrency=4, initial_concurrency=4)
+    assert [tuple(post) for post in newer] == [tuple(post) for post in everything if post.id > since]
+    # pages 1 to 3, and whatever was already in flight past them
+    assert 3 <= pages < 12
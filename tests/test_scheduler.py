@@ -0,0 +1,114 @@
+"""
+AdaptiveLimiter moves its cap with how the server copes, and whoever is
+waiting gets through as soon as the cap allows it.
+"""
+import asyncio
+
+from scheduler import AdaptiveLimiter
+
+
+async def respond(limiter, latency=None, throttled=False, times=1):
+    for _ in range(times):
+        await limiter.acquire()
+        await limiter.release(latency, throttled)
+
+
+def test_grows_after_a_cap_of_healthy_responses():
+    async def main():
+        limiter = AdaptiveLimiter(2, 1, 4)
+        await respond(limiter, 0.1)
+        assert limiter.limit == 2
+        await respond(limiter, 0.1)
+        assert limiter.limit == 3
+        await respond(limiter, 0.1, times=2)
+        assert limiter.limit == 3
+        await respond(limiter, 0.1)
+        assert limiter.limit == 4
+        # and no further
+        await respond(limiter, 0.1, times=20)
+        assert limiter.limit == 4
+    asyncio.run(main())
+
+
+def test_throttling_halves_down_to_the_minimum():
+    async def main():
+        limiter = AdaptiveLimiter(8, 2, 8)
+        await respond(limiter, throttled=True)
+        assert limiter.limit == 4
+        await respond(limiter, throttled=True)
+        assert limiter.limit == 2
+        await respond(limiter, throttled=True)
+        assert limiter.limit == 2
+        # healthy responses count again from scratch
+        await respond(limiter, 0.1)
+        assert limiter.limit == 2
+        await respond(limiter, 0.1)
+        assert limiter.limit == 3
+    asyncio.run(main())
+
+
+def test_shrinks_when_latency_drifts():
+    async def main():
+        limiter = AdaptiveLimiter(4, 1, 8, latency_tolerance=2.0)
+        await respond(limiter, 0.1)
+        assert limiter.limit == 4
+        # one slow response takes the smoothed latency to 0.28, past 0.2
+        await respond(limiter, 1.0)
+        assert limiter.limit == 3
+        await respond(limiter, 1.0, times=10)
+        assert limiter.limit == 1
+    asyncio.run(main())
+
+
+def test_a_failure_without_latency_only_frees_the_slot():
+    async def main():
+        limiter = AdaptiveLimiter(3, 1, 8)
+        await respond(limiter)
+        assert limiter.limit == 3 and limiter._in_flight == 0
+    asyncio.run(main())
+
+
+def test_waiters_get_through_as_slots_free_up():
+    async def main():
+        limiter = AdaptiveLimiter(2, 1, 2)
+        await limiter.acquire()
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        await limiter.release()
+        await asyncio.wait_for(waiting, 1)
+        assert limiter._in_flight == 2
+    asyncio.run(main())
+
+
+def test_waiters_get_through_as_the_cap_grows():
+    async def main():
+        limiter = AdaptiveLimiter(1, 1, 3)
+        await limiter.acquire()
+        waiting = [asyncio.ensure_future(limiter.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert not any(task.done() for task in waiting)
+        # one healthy response at a cap of 1 takes it to 2, which lets both in
+        await limiter.release(0.1)
+        assert limiter.limit == 2
+        await asyncio.wait_for(asyncio.gather(*waiting), 1)
+        assert limiter._in_flight == 2
+    asyncio.run(main())
+
+
+def test_nobody_new_gets_in_past_a_lowered_cap():
+    async def main():
+        limiter = AdaptiveLimiter(4, 1, 4)
+        for _ in range(4):
+            await limiter.acquire()
+        await limiter.release(throttled=True)
+        assert limiter.limit == 2 and limiter._in_flight == 3
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await limiter.release()
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        await limiter.release()
+        await asyncio.wait_for(waiting, 1)
+        assert limiter._in_flight == 2
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+The stdlib backend has to come up with the same thing as json.loads however
+the input is cut: numbers, strings, literals and multibyte characters split
+across chunks included.
+"""
+import json
+
+import pytest
+
+from jsonstreamer.stdlib.parse import StdlibError, StdlibParser
+from jsonstreamer.tape import Tape
+from jsonstreamer.yajl.parse import YajlListener
+
+
+class Builder(YajlListener):
+    # puts the value back together from the callbacks
+
+    def __init__(self):
+        self.stack = [[]]
+        self.keys = []
+
+    def _add(self, value):
+        top = self.stack[-1]
+        if isinstance(top, dict):
+            top[self.keys.pop()] = value
+        else:
+            top.append(value)
+
+    def on_null(self, ctx):
+        self._add(None)
+
+    def on_boolean(self, ctx, boolVal):
+        self._add(boolVal)
+
+    def on_integer(self, ctx, integerVal):
+        self._add(integerVal)
+
+    def on_double(self, ctx, doubleVal):
+        self._add(doubleVal)
+
+    def on_string(self, ctx, stringVal):
+        self._add(stringVal)
+
+    def on_start_map(self, ctx):
+        self.stack.append({})
+
+    def on_map_key(self, ctx, stringVal):
+        self.keys.append(stringVal)
+
+    def on_end_map(self, ctx):
+        self._add(self.stack.pop())
+
+    def on_start_array(self, ctx):
+        self.stack.append([])
+
+    def on_end_array(self, ctx):
+        self._add(self.stack.pop())
+
+
+def parse(chunks):
+    builder = Builder()
+    parser = StdlibParser(builder)
+    tape = Tape()
+    for chunk in chunks:
+        tape.write(chunk)
+        parser.parse(tape)
+    parser.close()
+    return builder.stack[0]
+
+
+DOCUMENTS = [
+    b'{"a": 2.5, "b": 1}',
+    b'[1, -2, 3.25, -4.5e-3, 6E+2, 7e10, 0, -0.0, 123456789012345678901234567890]',
+    b'{"n": 1e-5, "m": [2.0e+3, -1], "s": "x\\"y\\u00e9\\\\", "t": true, "f": false, "z": null}',
+    '[{"who": "Gérard ☃", "content": "🎲 = 14", "total": 14}, {"who": "Ōkami", "total": 2.5}, []]'.encode(),
+    b'  { "k" : [ 1 , { "x" : [ ] } , "" ] , "e" : { } }  ',
+    b'42',
+    b'-1.5e3',
+    b'"top level string"',
+    ]
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_every_split(document):
+    expected = json.loads(document)
+    assert parse([document]) == [expected]
+    for at in range(1, len(document)):
+        assert parse([document[:at], document[at:]]) == [expected], at
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+@pytest.mark.parametrize('size', [1, 2, 3, 8])
+def test_small_chunks(document, size):
+    expected = json.loads(document)
+    assert parse([document[i:i + size] for i in range(0, len(document), size)]) == [expected]
+
+
+@pytest.mark.parametrize('document', [b'{"a": 2.5.1}', b'[1, 2', b'{"a" 1}', b'[1 2]', b'[tru]'])
+def test_errors(document):
+    for at in range(1, len(document)):
+        with pytest.raises(StdlibError):
+            parse([document[:at], document[at:]])
@@ -0,0 +1,148 @@
+"""
+Pages go into the chatlog in order whatever order they come in, whether they
+waited in memory or on disk, and an export cut short picks up from whatever
+of the .part file its manifest vouches for.
+"""
+from os import listdir, path, remove
+
+from checkpoint import Checkpoint
+from writer import OrderedWriter, _encode
+import roll20
+
+
+PAGES = 12
+
+
+def page_text(page):
+    # varied sizes, and not all of it ASCII
+    return ''.join('page {} post {} ☃\n'.format(page, n) for n in range(page * 3))
+
+
+def expected():
+    return b''.join(_encode(page_text(page)) for page in range(PAGES, 0, -1))
+
+
+ORDER = [3, 12, 1, 7, 11, 2, 10, 4, 9, 5, 8, 6]
+
+
+def test_out_of_order_in_memory(tmp_path):
+    filepath = str(tmp_path / 'out.txt')
+    writes = []
+    writer = OrderedWriter(filepath, str(tmp_path), 1e9, lambda page, offset: writes.append((page, offset)))
+    writer.open(PAGES)
+    for page in ORDER:
+        writer.add(page, page_text(page))
+    writer.commit()
+    with open(filepath, 'rb') as output:
+        assert output.read() == expected()
+    # nothing was spilled, and each page was reported once it was on disk
+    assert [page for page, offset in writes] == list(range(PAGES, 0, -1))
+    assert writes[-1][1] == len(expected())
+    assert not path.exists(writer.part_filepath)
+
+
+def test_spills_over_budget(tmp_path):
+    filepath = str(tmp_path / 'out.txt')
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    budget = len(_encode(page_text(PAGES)))
+    spilled = []
+    writer = OrderedWriter(filepath, str(spill_dir), budget, lambda page, offset: offset is None and spilled.append(page))
+    writer.open(PAGES)
+    for page in ORDER:
+        writer.add(page, page_text(page))
+        assert writer._held_size <= budget
+    writer.commit()
+    with open(filepath, 'rb') as output:
+        assert output.read() == expected()
+    assert spilled
+    # read back and gone
+    assert listdir(str(spill_dir)) == []
+
+
+def test_budget_counts_bytes(tmp_path):
+    writer = OrderedWriter(str(tmp_path / 'out.txt'), str(tmp_path), 100)
+    writer.open(2)
+    # 40 characters, but 120 bytes in UTF-8: over budget
+    writer.add(1, '☃' * 40)
+    assert writer._held_size == 0
+    assert path.getsize(str(tmp_path / '1')) == len(_encode('☃' * 40))
+
+
+def interrupted_export(tmp_path, done):
+    """
+    Writes the pages in done as a run that crashed right after them would
+    have. Returns the pages that made it to disk, in the file or spilled.
+    """
+    filepath = str(tmp_path / 'out.txt')
+    checkpoint = Checkpoint(str(tmp_path / 'manifest'), PAGES)
+    checkpoint.open(lambda page: False)
+    saved = set()
+
+    def on_write(page, offset):
+        saved.add(page)
+        checkpoint.add(page, 'id{}'.format(page), offset)
+
+    writer = OrderedWriter(filepath, str(tmp_path), len(_encode(page_text(PAGES))), on_write)
+    writer.open(PAGES)
+    for page in done:
+        writer.add(page, page_text(page))
+    # whatever was still in memory is lost
+    writer.close()
+    checkpoint.close()
+    # some pages in the file, some spilled, some lost
+    assert PAGES in saved and 1 in saved and saved < set(done)
+    return filepath, writer.part_filepath, saved
+
+
+def not_in(saved):
+    return [page for page in range(1, PAGES + 1) if page not in saved]
+
+
+def resume(tmp_path, filepath, part_filepath):
+    """Picks the export up again like roll20._dump_all_pages, returning the pages it still needed."""
+    checkpoint = Checkpoint(str(tmp_path / 'manifest'), PAGES)
+    first, offset = roll20._resume_point(checkpoint, PAGES, part_filepath)
+    checkpoint.open(lambda page: page > first or path.exists(str(tmp_path / str(page))))
+    writer = OrderedWriter(filepath, str(tmp_path), 1e9,
+                           lambda page, offset: checkpoint.add(page, 'id{}'.format(page), offset))
+    writer.open(first, offset, [page for page in checkpoint.done if page <= first])
+    missing = [page for page in range(1, PAGES + 1) if page not in checkpoint.done]
+    for page in missing:
+        writer.add(page, page_text(page))
+    writer.commit()
+    checkpoint.close()
+    with open(filepath, 'rb') as output:
+        assert output.read() == expected()
+    return missing
+
+
+def test_resume_where_it_left_off(tmp_path):
+    filepath, part_filepath, saved = interrupted_export(tmp_path, ORDER[:8])
+    assert resume(tmp_path, filepath, part_filepath) == not_in(saved)
+
+
+def test_resume_with_part_ahead_of_manifest(tmp_path):
+    # crashed halfway through writing a page: the .part file has more in it
+    # than the manifest knows of, which has to go
+    filepath, part_filepath, saved = interrupted_export(tmp_path, ORDER[:8])
+    with open(part_filepath, 'ab') as part_file:
+        part_file.write(_encode(page_text(9)[:20]))
+    assert resume(tmp_path, filepath, part_filepath) == not_in(saved)
+
+
+def test_resume_with_manifest_ahead_of_part(tmp_path):
+    # the .part file lost what the manifest says is in there: start over
+    filepath, part_filepath, saved = interrupted_export(tmp_path, ORDER[:8])
+    size = path.getsize(part_filepath)
+    with open(part_filepath, 'r+b') as part_file:
+        part_file.truncate(size - 1)
+    checkpoint = Checkpoint(str(tmp_path / 'manifest'), PAGES)
+    assert roll20._resume_point(checkpoint, PAGES, part_filepath) == (PAGES, 0)
+    resume(tmp_path, filepath, part_filepath)
+
+
+def test_resume_without_part(tmp_path):
+    filepath, part_filepath, saved = interrupted_export(tmp_path, ORDER[:8])
+    remove(part_filepath)
+    resume(tmp_path, filepath, part_filepath)
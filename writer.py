@@ -0,0 +1,158 @@
+from locale import getpreferredencoding
+from os import fstat, linesep, path, remove, replace
+from shutil import copyfileobj
+
+import profiler
+
+
+def _encode(text):
+    # the bytes open(filepath, 'w') would have written, so the budget counts
+    # what pages actually take up and the file comes out just the same
+    if linesep != '\n':
+        text = text.replace('\n', linesep)
+    return text.encode(getpreferredencoding(False))
+
+
+class OrderedWriter:
+    """
+    Writes chatlog pages to a file in chronological order as they come in,
+    whatever order they come in: pages count backwards in time, so the file
+    starts with the last one and ends with page 1.
+
+    Pages that show up before their turn wait in memory, up to budget bytes'
+    worth once encoded; past that the ones furthest from their turn are
+    spilled to spill_dir and read back when it comes. Everything goes to
+    part_filepath (filepath.part unless given) first, which only becomes
+    filepath on commit().
+
+    on_write(page, offset) is called once a page is safely on disk, with the
+    size of the .part file right after it, or None if it was spilled.
+    """
+
+    def __init__(self, filepath, spill_dir, budget, on_write=None, part_filepath=None):
+        self._filepath = filepath
+        self.part_filepath = part_filepath or '{}.part'.format(filepath)
+        self._spill_dir = spill_dir
+        self._budget = budget
+        self._on_write = on_write
+        self._file = None
+        # next page due in the file, None until open()
+        self._next = None
+        self._held = {}
+        self._held_size = 0
+        self._spilled = set()
+
+
+    def open(self, first, offset=0, spilled=()):
+        """
+        Starts writing with page first. To pick up an interrupted run, offset
+        is how much of the .part file to keep and spilled the pages left in
+        spill_dir by it.
+        """
+        if offset:
+            with open(self.part_filepath, 'r+b') as part_file:
+                part_file.truncate(offset)
+            self._file = open(self.part_filepath, 'ab')
+        else:
+            self._file = open(self.part_filepath, 'wb')
+        self._spilled.update(spilled)
+        self._next = first
+        self._drain()
+
+
+    def add(self, page, text):
+        data = _encode(text)
+        self._held[page] = data
+        self._held_size += len(data)
+        if self._next is not None:
+            self._drain()
+        # the file fills up from the last page down, so the lowest pages have
+        # the longest wait ahead of them
+        for page in sorted(self._held):
+            if self._held_size <= self._budget:
+                break
+            self._spill(page)
+
+
+    def _drain(self):
+        while self._next > 0:
+            page = self._next
+            if page not in self._held and page not in self._spilled:
+                break
+            if profiler.enabled:
+                start = profiler.enter()
+                size = 0
+                try:
+                    size = self._write(page)
+                finally:
+                    profiler.leave('write', start, size)
+            else:
+                self._write(page)
+            if self._on_write is not None:
+                self._on_write(page, fstat(self._file.fileno()).st_size)
+            self._next -= 1
+
+
+    def _write(self, page):
+        # returns how many bytes it wrote
+        if page in self._held:
+            data = self._held.pop(page)
+            self._held_size -= len(data)
+            self._file.write(data)
+            size = len(data)
+        else:
+            spill_filepath = self._spill_filepath(page)
+            size = path.getsize(spill_filepath)
+            with open(spill_filepath, 'rb') as spill_file:
+                copyfileobj(spill_file, self._file)
+            self._spilled.remove(page)
+            remove(spill_filepath)
+        self._file.flush()
+        return size
+
+
+    def _spill(self, page):
+        data = self._held.pop(page)
+        self._held_size -= len(data)
+        if profiler.enabled:
+            start = profiler.enter()
+            try:
+                self._write_spill(page, data)
+            finally:
+                profiler.leave('write', start, len(data))
+        else:
+            self._write_spill(page, data)
+        self._spilled.add(page)
+        if self._on_write is not None:
+            self._on_write(page, None)
+
+
+    def _write_spill(self, page, data):
+        with open(self._spill_filepath(page), 'wb') as spill_file:
+            spill_file.write(data)
+
+
+    def _spill_filepath(self, page):
+        return '{}/{}'.format(self._spill_dir, page)
+
+
+    def commit(self):
+        """Renames the .part file to the real thing, once every page is in."""
+        if self._next != 0:
+            raise ValueError('page {} was never written'.format(self._next))
+        self._file.close()
+        replace(self.part_filepath, self._filepath)
+
+
+    def close(self):
+        """Stops writing, leaving the .part file to be picked up again."""
+        if self._file is not None:
+            self._file.close()
+
+
+    def discard(self):
+        self.close()
+        try:
+            remove(self.part_filepath)
+        except FileNotFoundError:
+            pass